@@ -1,24 +1,181 @@
 # cython: cdivision=True
 
-cdef rol(int val, int r_bits):
-    return (val << r_bits) & 0xFFFFFFFF | ((val & 0xFFFFFFFF) >> (32 - r_bits))
+cimport cython
+from libc.stdint cimport uint32_t
 
-cpdef decrypt(unsigned char *data, size_t data_len, unsigned int key1, unsigned short key2):
-    cdef unsigned int key = key1
+# Reversed CRC16-CCITT tables for slicing-by-16. CRC16_TABLE[0] has the same values as
+# pakdump.crc.CRC16_CCITT_TABLE_REVERSE, and CRC16_TABLE[k] advances CRC16_TABLE[k - 1]
+# by one more zero byte, so 16 input bytes can be consumed per loop iteration.
+cdef unsigned short CRC16_TABLE[16][256]
+
+
+cdef void _init_crc16_table():
+    cdef unsigned short crc
+    cdef int i, j, k
+
+    for i in range(256):
+        crc = i
+        for j in range(8):
+            if crc & 0x0001:
+                crc = (crc >> 1) ^ 0x8408
+            else:
+                crc = crc >> 1
+        CRC16_TABLE[0][i] = crc
+
+    for k in range(1, 16):
+        for i in range(256):
+            crc = CRC16_TABLE[k - 1][i]
+            CRC16_TABLE[k][i] = (crc >> 8) ^ CRC16_TABLE[0][crc & 0xFF]
+
+
+_init_crc16_table()
+
+
+# Reflected CRC32 (0xEDB88320, same as zlib) tables for slicing-by-16, built the same
+# way as the CRC16 tables above
+cdef uint32_t CRC32_TABLE[16][256]
+
+
+cdef void _init_crc32_table():
+    cdef uint32_t crc
+    cdef int i, j, k
+
+    for i in range(256):
+        crc = i
+        for j in range(8):
+            if crc & 0x00000001:
+                crc = (crc >> 1) ^ 0xEDB88320
+            else:
+                crc = crc >> 1
+        CRC32_TABLE[0][i] = crc
+
+    for k in range(1, 16):
+        for i in range(256):
+            crc = CRC32_TABLE[k - 1][i]
+            CRC32_TABLE[k][i] = (crc >> 8) ^ CRC32_TABLE[0][crc & 0xFF]
+
+
+_init_crc32_table()
+
+
+cdef inline uint32_t rol(uint32_t val, int r_bits) nogil:
+    return (val << r_bits) | (val >> (32 - r_bits))
+
+cpdef decrypt(unsigned char[::1] data, size_t data_len, unsigned int key1, unsigned short key2):
+    cdef uint32_t key = key1
     cdef size_t i = 0
+    cdef size_t j
+
+    # Pure C from here on, so let other threads run while we decrypt
+    with nogil:
+        while i < (data_len // 4) * 4:
+            key = rol(key + key2, 3)
+
+            data[i] ^= key & 0xff
+            data[i + 1] ^= (key >> 8) & 0xff
+            data[i + 2] ^= (key >> 16) & 0xff
+            data[i + 3] ^= (key >> 24) & 0xff
+
+            i += 4
 
-    while i < (data_len // 4) * 4:
         key = rol(key + key2, 3)
+        for j in range(data_len - i):
+            data[i] ^= (key >> (8 * j)) & 0xff
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cpdef bytearray apply_key_stream(
+    const unsigned char[::1] data, const unsigned char[::1] key_stream, bint reverse_input
+):
+    # XOR `data` with `key_stream` repeated out to its length. The data is reversed
+    # either on the way in (reverse_input) or on the way out, as mdbe.bin expects
+    cdef size_t data_len = data.shape[0]
+    cdef size_t period = key_stream.shape[0]
+    cdef bytearray output = bytearray(data_len)
+    cdef unsigned char *out = output
+    cdef size_t i
+    cdef size_t k = 0
+
+    if data_len == 0:
+        return output
+
+    with nogil:
+        for i in range(data_len):
+            if reverse_input:
+                out[i] = data[data_len - 1 - i] ^ key_stream[k]
+            else:
+                out[data_len - 1 - i] = data[i] ^ key_stream[k]
+            k += 1
+            if k == period:
+                k = 0
+
+    return output
+
+cdef unsigned short _crc16(const unsigned char *buf, size_t data_len) nogil:
+    cdef unsigned short crc = 0xFFFF
+    cdef size_t i = 0
+
+    # Slicing-by-16 over the bulk of the data
+    while i + 16 <= data_len:
+        crc ^= buf[i] | (buf[i + 1] << 8)
+        crc = (
+            CRC16_TABLE[15][crc & 0xFF] ^ CRC16_TABLE[14][crc >> 8]
+            ^ CRC16_TABLE[13][buf[i + 2]] ^ CRC16_TABLE[12][buf[i + 3]]
+            ^ CRC16_TABLE[11][buf[i + 4]] ^ CRC16_TABLE[10][buf[i + 5]]
+            ^ CRC16_TABLE[9][buf[i + 6]] ^ CRC16_TABLE[8][buf[i + 7]]
+            ^ CRC16_TABLE[7][buf[i + 8]] ^ CRC16_TABLE[6][buf[i + 9]]
+            ^ CRC16_TABLE[5][buf[i + 10]] ^ CRC16_TABLE[4][buf[i + 11]]
+            ^ CRC16_TABLE[3][buf[i + 12]] ^ CRC16_TABLE[2][buf[i + 13]]
+            ^ CRC16_TABLE[1][buf[i + 14]] ^ CRC16_TABLE[0][buf[i + 15]]
+        )
+        i += 16
+
+    # Then byte at a time for whatever is left
+    while i < data_len:
+        crc = (crc >> 8) ^ CRC16_TABLE[0][(crc ^ buf[i]) & 0xFF]
+        i += 1
+
+    return ~crc & 0xFFFF
+
+cdef uint32_t _crc32(const unsigned char *buf, size_t data_len) nogil:
+    cdef uint32_t crc = 0xFFFFFFFF
+    cdef size_t i = 0
+
+    # Slicing-by-16 over the bulk of the data
+    while i + 16 <= data_len:
+        crc ^= (
+            buf[i] | (buf[i + 1] << 8) | (buf[i + 2] << 16)
+            | (<uint32_t>buf[i + 3] << 24)
+        )
+        crc = (
+            CRC32_TABLE[15][crc & 0xFF] ^ CRC32_TABLE[14][(crc >> 8) & 0xFF]
+            ^ CRC32_TABLE[13][(crc >> 16) & 0xFF] ^ CRC32_TABLE[12][crc >> 24]
+            ^ CRC32_TABLE[11][buf[i + 4]] ^ CRC32_TABLE[10][buf[i + 5]]
+            ^ CRC32_TABLE[9][buf[i + 6]] ^ CRC32_TABLE[8][buf[i + 7]]
+            ^ CRC32_TABLE[7][buf[i + 8]] ^ CRC32_TABLE[6][buf[i + 9]]
+            ^ CRC32_TABLE[5][buf[i + 10]] ^ CRC32_TABLE[4][buf[i + 11]]
+            ^ CRC32_TABLE[3][buf[i + 12]] ^ CRC32_TABLE[2][buf[i + 13]]
+            ^ CRC32_TABLE[1][buf[i + 14]] ^ CRC32_TABLE[0][buf[i + 15]]
+        )
+        i += 16
+
+    # Then byte at a time for whatever is left
+    while i < data_len:
+        crc = (crc >> 8) ^ CRC32_TABLE[0][(crc ^ buf[i]) & 0xFF]
+        i += 1
+
+    return ~crc
 
-        data[i] ^= key & 0xff
-        data[i + 1] ^= (key >> 8) & 0xff
-        data[i + 2] ^= (key >> 16) & 0xff
-        data[i + 3] ^= (key >> 24) & 0xff
+cpdef unsigned short crc16_ccitt_reverse(bytes data):
+    return _crc16(data, len(data))
 
-        i += 4
+cpdef uint32_t crc32(bytes data):
+    return _crc32(data, len(data))
 
-    key = rol(key + key2, 3)
-    key_parts = [key & 0xff, (key >> 8) & 0xff, (key >> 16) & 0xff, (key >> 24) & 0xff]
-    for j in range(data_len - i):
-            data[i] ^= key_parts[j]
+cpdef list crc16_ccitt_reverse_batch(list data):
+    cdef bytes item
+    return [_crc16(item, len(item)) for item in data]
 
+cpdef list crc32_batch(list data):
+    cdef bytes item
+    return [_crc32(item, len(item)) for item in data]
@@ -1,13 +1,16 @@
 import hashlib
 import logging
-import re
+import mmap
+import os
 import struct
-from ctypes import c_ulong
+from concurrent.futures import ThreadPoolExecutor
+from itertools import groupby
+from operator import eq, itemgetter
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Set, Tuple, Union
 
 import pakdec
-from pakdump.crc import CRC16_CCITT_TABLE_REVERSE
+from pakdump.utils.bufpool import BufferPool
 
 
 logger = logging.getLogger(__name__)
@@ -27,6 +30,13 @@ class PackInfo(object):
         md5sum (int): MD5 sum of the file
     """
 
+    STRUCT_FORMAT = "<16sIHHII"
+    """Binary data format. Used in `struct.iter_unpack`"""
+    DATA_SIZE = 0x20
+    """Size of a single entry in `packinfo.bin`"""
+
+    __slots__ = ("crc32", "crc16", "packid", "offset", "filesize", "md5sum", "filename")
+
     def __init__(
         self,
         crc32: int,
@@ -42,7 +52,7 @@ class PackInfo(object):
         self.offset = offset
         self.filesize = filesize
         self.md5sum = md5sum.hex()
-        self.filename = None  # Gets filled in later
+        self.filename: Optional[str] = None  # Gets filled in later
 
     def __repr__(self) -> str:
         return (
@@ -63,18 +73,38 @@ class PakDumper(object):
         inputpath (Path): Path to `data` directory
         outputpath (Path): Path to output directory
         force (bool): Set to true to overwrite extracted files even if they exist
+        jobs (int) = 1: Number of threads to extract packs with
+        verify (bool) = False: Set to true to check the MD5 sum again after decryption
+    """
+
+    PACK_SAMPLE_SIZE = 4
+    """
+    Number of entries checked at the start of a pack to decide if the whole pack is
+    encrypted or not
     """
 
-    def __init__(self, inputpath: Path, outputpath: Path, force: bool) -> None:
+    def __init__(
+        self,
+        inputpath: Path,
+        outputpath: Path,
+        force: bool,
+        jobs: int = 1,
+        verify: bool = False,
+    ) -> None:
         self.inputpath = inputpath
         self.outputpath = outputpath
         self.packinfo_path = self.find_pakinfo()
         self.entries = self.parse_pack_data()
+        self.crc16s = {crc32: entry.crc16 for crc32, entry in self.entries.items()}
         self.packlist = self.generate_packlist()
-        self.crc32_table = self.generate_crc32_table()
         self.force = force
+        self.jobs = jobs
+        self.verify = verify
+        self.packmaps: Dict[int, mmap.mmap] = {}
+        self.buffers = BufferPool()
+        self.output_dirs: Set[Path] = set()
 
-    def get_md5sum(self, data: bytearray) -> str:
+    def get_md5sum(self, data: Union[bytearray, memoryview]) -> str:
         """
         Generate and return the MD5 sum for data extracted from the pack files.
 
@@ -82,7 +112,7 @@ class PakDumper(object):
         a secondary purpose to check if the extracted data needs to be de-crypted or not
 
         Args:
-            data (bytearray): File data to calculate the MD5 hash for
+            data (Union[bytearray, memoryview]): File data to calculate the MD5 hash for
 
         Returns:
             str: MD5 hash
@@ -91,19 +121,21 @@ class PakDumper(object):
         md5.update(data)
         return md5.digest().hex()
 
-    def decrypt(self, data: bytearray, entry: PackInfo) -> bytearray:
+    def decrypt(
+        self, data: Union[bytearray, memoryview], entry: PackInfo
+    ) -> Union[bytearray, memoryview]:
         """
         Decrypt extracted data
 
         Using pakdec (a Cython module) for fast decryption
 
         Args:
-            data (bytearray): Byte data to decrypt
+            data (Union[bytearray, memoryview]): Byte data to decrypt in place
             entry (:class:`.PackInfo`): PakInfo object with necessary data required for
                 decryption
 
         Returns:
-            bytearray: Decrypted data
+            Union[bytearray, memoryview]: Decrypted data
         """
         pakdec.decrypt(data, len(data), entry.crc32, entry.crc16)
         return data
@@ -118,177 +150,433 @@ class PakDumper(object):
         Returns:
             Optional[bytearray]: Extracted data or None if it can't be found
         """
+        data = bytearray(self.entries[key].filesize)
+
+        if not self.extract_data_into(key, data):
+            return None
+
+        return data
+
+    def extract_data_into(
+        self, key: int, data: Union[bytearray, memoryview], encrypted: bool = False
+    ) -> bool:
+        """
+        Extract the requested data out of the pack files into an existing buffer.
+        Decrypt if necessary.
+
+        Args:
+            key (int): Filename key of file to extract
+            data (Union[bytearray, memoryview]): Buffer to extract into. Must be
+                exactly the size of the file
+            encrypted (bool) = False: Set to true if the data is expected to be
+                encrypted, to skip checking the MD5 sum of the raw data first
 
+        Returns:
+            bool: True if the data was extracted
+        """
         entry = self.entries[key]
 
+        view = self.entry_view(entry)
+        if view is None:
+            return False
+
+        with view:
+            data[:] = view
+            if not encrypted and not self.is_encrypted(entry, view):
+                return True
+
+        if self.decrypt_data(entry, data):
+            return True
+
+        # The data might have been plain after all. Decrypting again undoes it
+        if encrypted:
+            self.decrypt(data, entry)
+            if not self.is_encrypted(entry, data):
+                return True
+
+        logger.error(f'MD5 sum does not match "{entry.md5sum}"')
+        return False
+
+    def entry_view(self, entry: PackInfo) -> Optional[memoryview]:
+        """
+        Get a view of the raw data for an entry, straight out of its mapped pack file.
+        Nothing is copied, so the view has to be released before the pack is closed.
+
+        Args:
+            entry (:class:`.PackInfo`): Entry to get the data for
+
+        Returns:
+            Optional[memoryview]: View of the raw data or None if it can't be found
+        """
+        packmap = self.open_pack(entry.packid)
+        if packmap is None:
+            return None
+
+        if entry.offset + entry.filesize > len(packmap):
+            logger.error(f"[BAD OFFSET] {entry}")
+            return None
+
+        with memoryview(packmap) as view:
+            return view[entry.offset : entry.offset + entry.filesize]
+
+    def is_encrypted(self, entry: PackInfo, data: Union[bytearray, memoryview]) -> bool:
+        """
+        Determine if the raw data for an entry needs to be decrypted
+
+        Args:
+            entry (:class:`.PackInfo`): Entry the data belongs to
+            data (Union[bytearray, memoryview]): Raw data for the entry
+
+        Returns:
+            bool: True if the data is encrypted
+        """
+        return self.get_md5sum(data) != entry.md5sum
+
+    def decrypt_data(self, entry: PackInfo, data: Union[bytearray, memoryview]) -> bool:
+        """
+        Decrypt the data for an entry in place
+
+        Args:
+            entry (:class:`.PackInfo`): Entry the data belongs to
+            data (Union[bytearray, memoryview]): Encrypted data for the entry
+
+        Returns:
+            bool: True if the data was decrypted
+        """
+        logger.debug(f"Decrypting file: {entry.filename}")
+        self.decrypt(data, entry)
+
+        # Decryption is deterministic, so only check the md5sum again if asked to
+        return not self.verify or self.get_md5sum(data) == entry.md5sum
+
+    def sample_encryption(self, keys: List[int]) -> Tuple[bool, Dict[int, bytearray]]:
+        """
+        Check the first few entries of a pack to see if the pack is encrypted. Packs
+        are usually either entirely encrypted or entirely plain.
+
+        Args:
+            keys (List[int]): Keys of the entries in the pack, sorted by offset
+
+        Returns:
+            Tuple[bool, Dict[int, bytearray]]: True if all the sampled entries are
+                encrypted, along with the decrypted data for every sampled entry
+                that was encrypted, so it isn't decrypted twice
+        """
+        decrypted: Dict[int, bytearray] = {}
+
+        for key in keys[: self.PACK_SAMPLE_SIZE]:
+            entry = self.entries[key]
+
+            view = self.entry_view(entry)
+            if view is None:
+                return False, decrypted
+
+            with view:
+                if not self.is_encrypted(entry, view):
+                    return False, decrypted
+                data = bytearray(view)
+
+            # Only count it as encrypted if decrypting actually gives the right data
+            self.decrypt(data, entry)
+            if self.is_encrypted(entry, data):
+                return False, decrypted
+            decrypted[key] = data
+
+        return bool(decrypted), decrypted
+
+    def open_pack(self, packid: int) -> Optional[mmap.mmap]:
+        """
+        Get a read only memory map of a pack file. Maps are cached, so each pack is
+        only mapped once no matter how many entries are extracted from it.
+
+        Args:
+            packid (int): ID of the pack file to map
+
+        Returns:
+            Optional[mmap.mmap]: Mapped pack file or None if it can't be found
+        """
+        if packid in self.packmaps:
+            return self.packmaps[packid]
+
         # Make sure the packid exists in the packlist
-        if entry.packid not in self.packlist:
-            logger.error(f"[BAD PACK_ID] {entry}")
+        if packid not in self.packlist:
+            logger.error(f"[BAD PACK_ID] {packid}")
             return None
 
         # Get the pack path and make sure it exists
-        packpath = self.inputpath / self.packlist[entry.packid]
+        packpath = self.inputpath / self.packlist[packid]
         if not packpath.exists():
             logger.error(f"Packpath does not exist: {packpath}")
             return None
 
-        # Grab the data from the pack
         logger.debug(f"Loading packpath: {packpath}")
-        data = bytearray(
-            packpath.open("rb").read()[entry.offset : entry.offset + entry.filesize]
-        )
+        with packpath.open("rb") as f:
+            try:
+                packmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                logger.error(f"Packpath is empty: {packpath}")
+                return None
+        self.packmaps[packid] = packmap
 
-        # If the data is encrypted, lets decrypt it
-        data_md5 = self.get_md5sum(data)
-        if data_md5 != entry.md5sum:
-            logger.debug(f"Decrypting file: {entry.filename}")
-            data = self.decrypt(data, entry)
+        return packmap
 
-        # Make sure the md5sum matches
-        data_md5 = self.get_md5sum(data)
-        if data_md5 != entry.md5sum:
-            logger.error(f'MD5 sum "{data_md5}" does not match "{entry.md5sum}"')
-            return None
+    def close_pack(self, packid: int) -> None:
+        """
+        Close the memory map for a pack file if it has been mapped
 
-        return data
+        Args:
+            packid (int): ID of the pack file to close
+        """
+        packmap = self.packmaps.pop(packid, None)
+        if packmap is not None:
+            packmap.close()
+
+    def close(self) -> None:
+        """
+        Close any pack files that have been mapped, and drop the spare buffers
+        """
+        for packid in list(self.packmaps):
+            self.close_pack(packid)
+        self.buffers.clear()
 
-    def extract_data(self, key: int) -> None:
+    def extract_data(self, key: int, encrypted: bool = False) -> None:
         """
         Given the file hash key, extract the data and write it to the output dir
 
         Args:
             key (int): Filename key of file to extract
+            encrypted (bool) = False: Set to true if the data is expected to be
+                encrypted, to skip checking the MD5 sum of the raw data first
         """
-        data = self.extract_data_mem(key)
+        entry = self.entries[key]
 
-        if data is None:
-            logger.error(f"Could not extract data from: {self.entries[key].filename}")
+        view = self.entry_view(entry)
+        if view is None:
+            logger.error(f"Could not extract data from: {entry.filename}")
             return
 
+        # Plain data gets written straight out of the mapped pack
+        with view:
+            if not encrypted and not self.is_encrypted(entry, view):
+                self.write_data(entry, view)
+                return
+
+        # Otherwise decrypt into a pooled buffer, it goes back to the pool once it's
+        # written out
+        buffer = self.buffers.acquire(entry.filesize)
+        try:
+            with memoryview(buffer)[: entry.filesize] as data:
+                if self.extract_data_into(key, data, encrypted=True):
+                    self.write_data(entry, data)
+                else:
+                    logger.error(f"Could not extract data from: {entry.filename}")
+        finally:
+            self.buffers.release(buffer)
+
+    def write_data(self, entry: PackInfo, data: memoryview) -> None:
+        """
+        Write extracted data for an entry to the output dir
+
+        Args:
+            entry (:class:`.PackInfo`): Entry the data belongs to
+            data (memoryview): Extracted data
+        """
         # Write the data
-        filepath = self.entries[key].filename
+        filepath = str(entry.filename)
         filepath = filepath[1:] if filepath.startswith("/") else filepath
         output_path = self.outputpath / filepath
         logger.debug(f"Writing: {output_path}")
 
-        # Make sure parent directory exists
-        output_path.parent.mkdir(parents=True, exist_ok=True)
-
-        # Only write the data if it doesn't already exist
-        if output_path.exists() and not self.force:
+        # Make sure parent directory exists. Lots of files share a directory, so
+        # remember which ones have been made already
+        if output_path.parent not in self.output_dirs:
+            output_path.parent.mkdir(parents=True, exist_ok=True)
+            self.output_dirs.add(output_path.parent)
+
+        # Only write the data if it doesn't already exist. Let the OS check that with
+        # O_EXCL rather than doing a separate exists() call first. The umask decides
+        # the permissions, the same as open() does
+        flags = os.O_WRONLY | os.O_CREAT | getattr(os, "O_BINARY", 0)
+        flags |= os.O_TRUNC if self.force else os.O_EXCL
+        try:
+            fd = os.open(output_path, flags, 0o666)
+        except FileExistsError:
             logger.info(f"File already exists: {output_path}")
             return
 
-        output_path.open("wb").write(data)
+        # Write straight to the file descriptor, skipping Python's buffered io
+        try:
+            while data:
+                data = data[os.write(fd, data) :]
+        finally:
+            os.close(fd)
+
+    def extract_pack(self, packid: int, keys: List[int]) -> int:
+        """
+        Extract all the entries from a single pack file, then unmap it
+
+        Args:
+            packid (int): ID of the pack file the entries are in
+            keys (List[int]): Filename keys of the entries to extract. The entries
+                must all have a filename
+
+        Returns:
+            int: Number of files extracted
+        """
+        # Verifying checks the MD5 sum of every decrypted entry anyway, so for packs
+        # that are entirely encrypted the MD5 sum of the raw data can be skipped
+        encrypted = False
+        decrypted: Dict[int, bytearray] = {}
+        if self.verify:
+            encrypted, decrypted = self.sample_encryption(keys)
+
+        for key in keys:
+            entry = self.entries[key]
+            logger.info(f"Extracting File: {entry.filename}")
+
+            # Sampled entries have already been decrypted and checked
+            data = decrypted.pop(key, None)
+            if data is None:
+                self.extract_data(key, encrypted)
+                continue
+
+            with memoryview(data) as view:
+                self.write_data(entry, view)
+
+        self.close_pack(packid)
+        return len(keys)
 
     def dump(self) -> None:
         """
         Dump the data
         """
-        sorted_keys = sorted(
-            self.entries, key=lambda x: (self.entries[x].packid, self.entries[x].offset)
-        )
+        # Only entries with a known filename can be extracted. Sorting plain tuples
+        # keeps the comparisons in C rather than calling a key function per entry
+        todo = [
+            (entry.packid, entry.offset, key)
+            for key, entry in self.entries.items()
+            if entry.filename is not None
+        ]
+        todo.sort()
+
+        # Work through one pack at a time so it is read front to back once, and only
+        # has to stay mapped while its own entries are being extracted
+        packs = [
+            (packid, [key for _, _, key in group])
+            for packid, group in groupby(todo, key=itemgetter(0))
+        ]
 
         extracted = 0
-        for key in sorted_keys:
-            entry = self.entries[key]
-            if entry.filename is not None:
-                logger.info(f"Extracting File: {entry.filename}")
-                self.extract_data(key)
-                extracted += 1
+        try:
+            if self.jobs > 1:
+                # Packs are independent, so hand each one to a worker thread.
+                # Decryption, MD5 sums and file writes all release the GIL, so one
+                # pack's reads and writes overlap with another pack's decryption
+                with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+                    futures = [
+                        executor.submit(self.extract_pack, packid, keys)
+                        for packid, keys in packs
+                    ]
+                    extracted = sum(future.result() for future in futures)
+            else:
+                for packid, keys in packs:
+                    extracted += self.extract_pack(packid, keys)
+        finally:
+            self.close()
 
         logger.info(f"Extracted {extracted} files.")
         logger.info(f"{len(self.entries) - extracted} files remaining.")
 
-    def file_exists(self, filepath: Path) -> bool:
+    def file_exists(self, filepath: Union[str, Path]) -> bool:
         """
         Determine if the filename exists in the pack data.
         Add the filename to the entry if we find a match.
 
         Args:
-            filepath (Path): Filepath to check
+            filepath (Union[str, Path]): Filepath to check
 
         Returns:
             bool: True if file exists in the data
         """
-        crc32 = self.calculate_filename_crc32(filepath)
-        crc16 = self.calculate_filename_crc16(filepath)
-        exists = crc32 in self.entries and self.entries[crc32].crc16 == crc16
+        return self.files_exist([str(filepath)])[0]
 
-        if exists:
-            self.entries[crc32].filename = str(filepath)
-        else:
-            logger.error(f"Filepath does not exist: {filepath}")
+    def files_exist(self, filepaths: List[str]) -> List[bool]:
+        """
+        Determine if each filename exists in the pack data, the same as
+        :meth:`file_exists` but with all the CRCs calculated in one go.
+        Add the filename to the entry for every match.
 
-        return exists
+        Args:
+            filepaths (List[str]): Filepaths to check
 
-    def calculate_filename_crc16(self, filename: Path) -> int:
+        Returns:
+            List[bool]: True for each file that exists in the data
+        """
+        crc32s = pakdec.crc32_batch(
+            [self.normalize_crc32_filename(f).encode("ASCII") for f in filepaths]
+        )
+        crc16s = pakdec.crc16_ccitt_reverse_batch(
+            [f.encode("ASCII") for f in filepaths]
+        )
+
+        # Check every crc pair against the known entries in one pass, without going
+        # through Python code per filename
+        found = list(map(eq, map(self.crc16s.get, crc32s), crc16s))
+
+        for filepath, crc32, exists in zip(filepaths, crc32s, found):
+            if exists:
+                self.entries[crc32].filename = filepath
+            else:
+                logger.error(f"Filepath does not exist: {filepath}")
+
+        return found
+
+    def calculate_filename_crc16(self, filename: Union[str, Path]) -> int:
         """
         Calculate the crc16 filename hash
 
+        Using pakdec (a Cython module) for fast calculation
+
         Args:
-            filename (Path): Filepath to create the CRC16 for
+            filename (Union[str, Path]): Filepath to create the CRC16 for
 
         Returns:
             int: CRC16 for filename
         """
-        filebytes = bytearray(str(filename), "ASCII")
-        crc16 = 0xFFFF
-        for b in filebytes:
-            crc16 = (
-                (crc16 >> 8) ^ CRC16_CCITT_TABLE_REVERSE[(crc16 ^ b) & 0x00FF]
-            ) & 0xFFFF
+        return pakdec.crc16_ccitt_reverse(str(filename).encode("ASCII"))
 
-        return ~crc16 & 0xFFFF
-
-    def calculate_filename_crc32(self, filename: Path) -> int:
+    def calculate_filename_crc32(self, filename: Union[str, Path]) -> int:
         """
         Calculate the crc32 filename hash
+
+        Using pakdec (a Cython module) for fast calculation
+
         Args:
-            filename (Path): Filepath to create the CRC32 for
+            filename (Union[str, Path]): Filepath to create the CRC32 for
 
         Returns:
             int: CRC32 for filename
         """
-        # Normalize paths to proper formats
-        filestr = str(filename)
+        filestr = self.normalize_crc32_filename(str(filename))
+        return pakdec.crc32(filestr.encode("ASCII"))
 
-        # Make sure we have a leading '/'
-        filestr = "/" + filestr if filestr.startswith("data/") else filestr
-
-        # /data/aep paths should be lowercase
-        filestr = filestr.lower() if filestr.startswith("/data/aep") else filestr
-
-        # Calculate crc32
-        filebytes = bytearray(filestr, "ASCII")
-        crc32_sum = 0xFFFFFFFF
-        for i in range(len(filebytes)):
-            crc32_sum = self.crc32_table[(crc32_sum & 0xFF) ^ filebytes[i]] ^ (
-                (crc32_sum >> 8) & 0xFFFFFFFF
-            )
-        return ~crc32_sum & 0xFFFFFFFF
-
-    def generate_crc32_table(self) -> List[int]:
+    def normalize_crc32_filename(self, filestr: str) -> str:
         """
-        Generate a crc32 table. Used fo calculating the filename hash
+        Normalize a filename to the format used for the crc32 filename hash
 
-        I'm not really sure exactly how this was determined
+        Args:
+            filestr (str): Filepath to normalize
 
         Returns:
-            List[int]: CRC32 table
+            str: Normalized filepath
         """
-        crc32_table = []
-        crc32_constant = 0xEDB88320
+        # Make sure we have a leading '/'
+        filestr = "/" + filestr if filestr.startswith("data/") else filestr
 
-        for i in range(0, 256):
-            crc = i
-            for j in range(0, 8):
-                if crc & 0x00000001:
-                    crc = int(c_ulong(crc >> 1).value) ^ crc32_constant
-                else:
-                    crc = int(c_ulong(crc >> 1).value)
-            crc32_table.append(crc)
-        return crc32_table
+        # /data/aep paths should be lowercase
+        filestr = filestr.lower() if filestr.startswith("/data/aep") else filestr
+
+        return filestr
 
     def generate_packlist(self) -> Dict[int, Path]:
         """
@@ -302,11 +590,12 @@ class PakDumper(object):
         # Grab the packid
         items: Dict[int, Path] = {}
         for pack in packlist:
-            r = re.match(r"pack(?P<id>\d\d\d\d).pak", pack.parts[-1])
-            if r is None:
-                logger.error("Packpath is malformed: {pack}")
+            # The glob already checked the `pack` prefix and `.pak` suffix
+            name = pack.name
+            if len(name) != 12 or not name[4:8].isdecimal():
+                logger.error(f"Packpath is malformed: {pack}")
                 continue
-            pak_id = int(r.group("id"))
+            pak_id = int(name[4:8])
             items[pak_id] = pack
 
         return items
@@ -325,21 +614,20 @@ class PakDumper(object):
             end_address = int.from_bytes(f.read(0x04), "little")
             f.seek(0x10)
 
-            while f.tell() < end_address:
-                md5sum = f.read(0x10)
-                data = f.read(0x10)
+            # Read every entry in one go, and let struct walk through them
+            count = -(-(end_address - 0x10) // PackInfo.DATA_SIZE)
+            data = f.read(count * PackInfo.DATA_SIZE)
+            data = data[: len(data) - (len(data) % PackInfo.DATA_SIZE)]
 
-                if not md5sum or not data:
-                    break
-
-                crc32, crc16, packid, offset, filesize = struct.unpack("<IHHII", data)
-                entry = PackInfo(crc32, crc16, packid, offset, filesize, md5sum)
+        for md5sum, crc32, crc16, packid, offset, filesize in struct.iter_unpack(
+            PackInfo.STRUCT_FORMAT, data
+        ):
+            if crc32 in entries and entries[crc32].crc16 == crc16:
+                logger.debug(f"Found key already: {entries[crc32]}")
+                continue
 
-                if crc32 in entries and entries[crc32].crc16 == crc16:
-                    logger.debug(f"Found key already: {entries[crc32]}")
-                    continue
+            entries[crc32] = PackInfo(crc32, crc16, packid, offset, filesize, md5sum)
 
-                entries[crc32] = entry
         return entries
 
     def find_pakinfo(self) -> Path:
@@ -1,5 +1,11 @@
+import hashlib
+import json
 import logging
+import os
+from contextlib import suppress
+from itertools import islice
 from pathlib import Path
+from typing import Iterable, Iterator, Optional, Set
 
 from pakdump.dumper import PakDumper
 
@@ -10,15 +16,156 @@ logger = logging.getLogger(__name__)
 DEFAULT_FILELIST_PATH = Path(__file__).parent / "filelist.txt"
 """Location of our default filelist"""
 
+FILELIST_BATCH_SIZE = 4096
+"""Number of filelist lines to hash at a time"""
 
-def load_filelist(dumper: PakDumper, filepath: Path = DEFAULT_FILELIST_PATH) -> None:
+CACHE_VERSION = 1
+"""Bump this if the cached data or the filename hashing ever changes"""
+
+
+def load_filelist(
+    dumper: PakDumper, filepath: Path = DEFAULT_FILELIST_PATH, cache: bool = True
+) -> None:
     """
     Load in the list of files to extract into the PakDumper object
 
+    The results are cached per filelist and `packinfo.bin`, so the next run with the
+    same files can skip hashing every filename.
+
     Args:
         dumper (:class:`pakdump.dumper.PakDumper`): Instantiated PakDumper object
+        filepath (Path) = DEFAULT_FILELIST_PATH: Path to list of files to extract
+        cache (bool) = True: Set to false to ignore and not write the cache
     """
+    cache_path = get_cache_path(dumper, filepath) if cache else None
+
+    if cache_path is not None and load_cache(dumper, cache_path):
+        return
+
+    # Stream the filelist through in batches. Each batch is hashed in one go, but
+    # the whole list never has to be held in memory at once. Plain strings are
+    # passed through, no need to build a Path just to hash it
+    missing = []
     with filepath.open() as f:
-        for line in f:
-            fp = Path(line.strip())
-            dumper.file_exists(fp)
+        lines = unique_lines(f)
+        while True:
+            filenames = list(islice(lines, FILELIST_BATCH_SIZE))
+            if not filenames:
+                break
+
+            exists = dumper.files_exist(filenames)
+            missing += [name for name, found in zip(filenames, exists) if not found]
+
+    if cache_path is not None:
+        found = [
+            (crc32, entry.filename)
+            for crc32, entry in dumper.entries.items()
+            if entry.filename is not None
+        ]
+
+        # Write to a temp file and move it into place, so another run never sees a
+        # half written cache
+        tmp_path = cache_path.with_name(f"{cache_path.name}.{os.getpid()}.tmp")
+        try:
+            cache_path.parent.mkdir(parents=True, exist_ok=True)
+            with tmp_path.open("w") as f:
+                json.dump({"found": found, "missing": missing}, f)
+            os.replace(tmp_path, cache_path)
+        except OSError as e:
+            logger.debug(f"Could not write filelist cache: {e}")
+            with suppress(OSError):
+                tmp_path.unlink()
+
+
+def unique_lines(lines: Iterable[str]) -> Iterator[str]:
+    """
+    Strip each line and skip any that have already been seen, so duplicate entries
+    in a filelist are only hashed once
+
+    Args:
+        lines (Iterable[str]): Lines to filter
+
+    Yields:
+        str: Each unique stripped line, in the order they first appear
+    """
+    seen: Set[str] = set()
+    for line in lines:
+        line = line.strip()
+        if line not in seen:
+            seen.add(line)
+            yield line
+
+
+def load_cache(dumper: PakDumper, cache_path: Path) -> bool:
+    """
+    Load the results of a previous :func:`load_filelist` into the PakDumper object
+
+    Args:
+        dumper (:class:`pakdump.dumper.PakDumper`): Instantiated PakDumper object
+        cache_path (Path): Path to the cache file
+
+    Returns:
+        bool: True if the cache was loaded, False if it doesn't exist or is unusable
+    """
+    try:
+        with cache_path.open() as f:
+            cached = json.load(f)
+        found = [(int(crc32), str(filename)) for crc32, filename in cached["found"]]
+        missing = [str(filename) for filename in cached["missing"]]
+    except (OSError, ValueError, KeyError, TypeError):
+        return False
+
+    if any(crc32 not in dumper.entries for crc32, _ in found):
+        return False
+
+    logger.debug(f"Loaded cached filelist: {cache_path}")
+    for crc32, filename in found:
+        dumper.entries[crc32].filename = filename
+    for filename in missing:
+        logger.error(f"Filepath does not exist: {filename}")
+
+    return True
+
+
+def get_cache_dir() -> Optional[Path]:
+    """
+    Get the directory to cache filelist results in. This follows the XDG spec, where
+    an unset, empty or relative `XDG_CACHE_HOME` means `~/.cache` is used instead.
+
+    Returns:
+        Optional[Path]: Path to the cache directory or None if there's no home
+            directory to put it in
+    """
+    cache_home = os.environ.get("XDG_CACHE_HOME", "")
+    if os.path.isabs(cache_home):
+        return Path(cache_home) / "pakdump"
+
+    try:
+        return Path.home() / ".cache" / "pakdump"
+    except (KeyError, RuntimeError):
+        return None
+
+
+def get_cache_path(dumper: PakDumper, filepath: Path) -> Optional[Path]:
+    """
+    Get the cache file for a filelist and the `packinfo.bin` the dumper loaded
+
+    Args:
+        dumper (:class:`pakdump.dumper.PakDumper`): Instantiated PakDumper object
+        filepath (Path): Path to list of files to extract
+
+    Returns:
+        Optional[Path]: Path to the cache file or None if the inputs can't be read or
+            there's nowhere to put the cache
+    """
+    cache_dir = get_cache_dir()
+    if cache_dir is None:
+        return None
+
+    try:
+        filelist_md5 = hashlib.md5(filepath.read_bytes()).hexdigest()
+        packinfo_md5 = hashlib.md5(dumper.packinfo_path.read_bytes()).hexdigest()
+    except OSError:
+        return None
+
+    return cache_dir / f"v{CACHE_VERSION}-{filelist_md5}-{packinfo_md5}.json"
@@ -1,10 +1,10 @@
 import argparse
 import logging
+import os
 from pathlib import Path
 from typing import Optional, Sequence
 
-from pakdump.mdbe import MDB
-from pakdump.utils.ap import FullPath
+from pakdump.utils.ap import FullPath, make_base_parser
 
 
 logger = logging.getLogger(__name__)
@@ -26,6 +26,9 @@ def main(args: Optional[Sequence[str]] = None) -> None:
         format="[ %(asctime)s | %(levelname)-8s | %(name)s ]\n%(message)s",
     )
 
+    # Deferred so that `--help` and argument errors don't pay for importing the codec
+    from pakdump.mdbe import MDB
+
     MDB(p_args.input, p_args.output, p_args.force)
 
 
@@ -43,7 +46,7 @@ def parse_args(args: Optional[Sequence[str]] = None) -> argparse.Namespace:
         :class:`argparse.ArgumentTypeError`: If input path doesn't point to `mdbe.bin`
     """
 
-    parser = argparse.ArgumentParser(
+    parser = make_base_parser(
         description=(
             "Read in JSON encoded MusidDB data, encrypt it and dump it into the binary "
             "`mdbe.bin` format for GFDM V8"
@@ -72,35 +75,9 @@ def parse_args(args: Optional[Sequence[str]] = None) -> argparse.Namespace:
         help="overwrite the output file even if it already exists",
     )
 
-    logger_group_parent = parser.add_argument_group(
-        title="logging arguments",
-        description="Control what log level the log outputs (default: ERROR)",
-    )
-    logger_group = logger_group_parent.add_mutually_exclusive_group()
-    default_log_level = logging.ERROR
-
-    logger_group.add_argument(
-        "-d",
-        "--debug",
-        dest="log_level",
-        action="store_const",
-        const=logging.DEBUG,
-        default=default_log_level,
-        help="Set log level to DEBUG",
-    )
-    logger_group.add_argument(
-        "-v",
-        "--verbose",
-        dest="log_level",
-        action="store_const",
-        const=logging.INFO,
-        default=default_log_level,
-        help="Set log level to INFO",
-    )
-
     parsed_args = parser.parse_args(args)
 
-    if parsed_args.input.suffix.lower() != ".json":
+    if not os.fspath(parsed_args.input).lower().endswith(".json"):
         raise argparse.ArgumentTypeError('input must be a ".json" file')
 
     return parsed_args
@@ -1,10 +1,10 @@
 import argparse
 import logging
+import os
 from pathlib import Path
 from typing import Optional, Sequence
 
-from pakdump.mdbe import MDB
-from pakdump.utils.ap import FullDirPath, FullPath
+from pakdump.utils.ap import FullDirPath, FullPath, make_base_parser
 
 
 logger = logging.getLogger(__name__)
@@ -25,6 +25,9 @@ def main(args: Optional[Sequence[str]] = None) -> None:
         format="[ %(asctime)s | %(levelname)-8s | %(name)s ]\n%(message)s",
     )
 
+    # Deferred so that `--help` and argument errors don't pay for importing the codec
+    from pakdump.mdbe import MDB
+
     mdb = MDB(
         p_args.input, p_args.output, p_args.force, pretty_print=p_args.pretty_print
     )
@@ -45,7 +48,7 @@ def parse_args(args: Optional[Sequence[str]] = None) -> argparse.Namespace:
         :class:`argparse.ArgumentTypeError`: If input path doesn't point to `mdbe.bin`
     """
 
-    parser = argparse.ArgumentParser(
+    parser = make_base_parser(
         description=(
             "Decrypt and dump the musicdb from the `mdbe.bin` file from GFDM V8 as JSON"
         )
@@ -88,35 +91,9 @@ def parse_args(args: Optional[Sequence[str]] = None) -> argparse.Namespace:
         help="enable pretty print for the output file",
     )
 
-    logger_group_parent = parser.add_argument_group(
-        title="logging arguments",
-        description="Control what log level the log outputs (default: ERROR)",
-    )
-    logger_group = logger_group_parent.add_mutually_exclusive_group()
-    default_log_level = logging.ERROR
-
-    logger_group.add_argument(
-        "-d",
-        "--debug",
-        dest="log_level",
-        action="store_const",
-        const=logging.DEBUG,
-        default=default_log_level,
-        help="Set log level to DEBUG",
-    )
-    logger_group.add_argument(
-        "-v",
-        "--verbose",
-        dest="log_level",
-        action="store_const",
-        const=logging.INFO,
-        default=default_log_level,
-        help="Set log level to INFO",
-    )
-
     parsed_args = parser.parse_args(args)
 
-    if not parsed_args.input.parts[-1].endswith("mdbe.bin"):
+    if not os.path.basename(parsed_args.input).endswith("mdbe.bin"):
         raise argparse.ArgumentTypeError('input must be the "mdbe.bin" file')
 
     return parsed_args
@@ -2,18 +2,92 @@ from __future__ import annotations
 
 import json
 import logging
+import mmap
 import struct
+from functools import cached_property, lru_cache
+from itertools import chain
 from pathlib import Path
-from typing import Any, Dict, List, Optional, Tuple
+from types import ModuleType
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    Union,
+)
 
-from lxml import etree
-from lxml.builder import E
+import pakdec
+
+
+if TYPE_CHECKING:
+    from lxml import etree
+
+
+try:
+    # orjson is a lot quicker than the json module, especially with indentation
+    import orjson
+
+    def _json_dumps(data: Any, pretty_print: bool) -> bytes:
+        option = orjson.OPT_NON_STR_KEYS
+        if pretty_print:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(data, option=option)
+
+    def _json_loads(data: bytes) -> Any:
+        return orjson.loads(data)
+
+except ImportError:
+
+    def _json_dumps(data: Any, pretty_print: bool) -> bytes:
+        indent = 2 if pretty_print else None
+        return json.dumps(data, indent=indent).encode("UTF-8")
+
+    def _json_loads(data: bytes) -> Any:
+        return json.loads(data)
 
 
 logger = logging.getLogger(__name__)
 
+_NON_PRINTABLE = bytes(c for c in range(256) if not 31 < c < 127)
+"""Every byte value that isn't printable ASCII"""
+_U8_STRS = tuple(map(str, range(256)))
+"""Decimal string of every byte value, to avoid calling `str` per byte"""
+
+
+@lru_cache(maxsize=None)
+def _etree() -> ModuleType:
+    """
+    Import `lxml.etree` the first time any XML is built, so JSON only runs never pay
+    for it. Cached, so the hot XML loops don't go through the import system
+
+    Returns:
+        ModuleType: The `lxml.etree` module
+    """
+    from lxml import etree
+
+    return etree
+
+
+def _xml_escape(text: str) -> str:
+    """
+    Escape `&`, `<` and `>` so the text can be placed inside an XML element
+
+    Args:
+        text (str): Text to escape
 
-def _xe(name: str, body: Any, type: str, count: int = 1) -> E:
+    Returns:
+        str: Escaped text
+    """
+    return text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+
+
+def _xe(
+    name: str, body: Any, type: str, count: int = 1, parent: Optional[etree] = None
+) -> etree:
     """
     Helper function to build an xml element with `__type` and `__count` attributes if
     necessary.
@@ -23,14 +97,142 @@ def _xe(name: str, body: Any, type: str, count: int = 1) -> E:
         body (Any): XML Element Body (or text)
         type (str): type of `body` element (i.e. u8, s32, etc)
         count (int) = 1: How many elements of `type` exist in `body`
+        parent (Optional[:class:`lxml.etree`]) = None: Element to create the new
+            element in, rather than creating it on its own and moving it later
 
     Returns:
-        XML Element :obj:`E`: Constructed XML Element
+        :class:`lxml.etree`: Constructed XML Element
     """
+    etree = _etree()
+
     attrs = {"__type": type}
     if count > 1:
         attrs["__count"] = str(count)
-    return E(name, str(body), attrs)
+    if parent is None:
+        element = etree.Element(name, attrs)
+    else:
+        element = etree.SubElement(parent, name, attrs)
+    element.text = str(body)
+    return element
+
+
+def _xml_template(name: str, fields: Tuple[Tuple[str, str, int], ...]) -> str:
+    """
+    Build a `str.format` template for an XML element whose children are all simple
+    `_xe` style elements, so it can be filled in and parsed in one go.
+
+    Args:
+        name (str): XML Element Name of the parent element
+        fields (Tuple[Tuple[str, str, int], ...]): Child element name, type and count
+
+    Returns:
+        str: Template with one positional `{}` field per child element body
+    """
+    children = []
+    for child, type, count in fields:
+        count_attr = f' __count="{count}"' if count > 1 else ""
+        children.append(f'<{child} __type="{type}"{count_attr}>{{}}</{child}>')
+    return f"<{name}>{''.join(children)}</{name}>"
+
+
+def _key_stream(key: List[int]) -> bytes:
+    """
+    Build one period of the key stream used to encrypt and decrypt `mdbe.bin`.
+
+    The key byte for index `idx` only depends on `idx % 9` and `idx % 8`, so the
+    stream repeats every 72 bytes.
+
+    Args:
+        key (List[int]): 9 byte encryption key
+
+    Returns:
+        bytes: The first 72 bytes of the key stream
+    """
+    return bytes(
+        (
+            idx
+            + 16 * (idx % 8)
+            + (key[idx % 9] ^ (9 * (idx // 9) - idx + 127))
+            - 9 * (idx // 9)
+        )
+        for idx in range(72)
+    )
+
+
+def _unpack_records(
+    record_struct: struct.Struct, data: bytearray, offset: int, stride: int, count: int
+) -> Iterator[Tuple[Any, ...]]:
+    """
+    Unpack `count` fixed size records laid out every `stride` bytes from `offset`
+
+    Args:
+        record_struct (:class:`struct.Struct`): Format of a single record
+        data (bytearray): Buffer holding the records
+        offset (int): Offset of the first record
+        stride (int): Distance in bytes from the start of one record to the next
+        count (int): Number of records
+
+    Returns:
+        Iterator[Tuple[Any, ...]]: Unpacked data of each record
+
+    Raises:
+        struct.error: If `data` is too short to hold every record
+    """
+    count = max(count, 0)
+
+    # Records normally sit back to back, so they can all be unpacked in one go
+    if stride == record_struct.size:
+        view = memoryview(data)[offset : offset + stride * count]
+        # Slicing stops quietly at the end of the data, and iter_unpack would then
+        # quietly drop a trailing partial record
+        if len(view) != stride * count:
+            raise struct.error(
+                f"unpacking {count} records of {stride} bytes at offset {offset} "
+                f"requires a buffer of at least {offset + stride * count} bytes "
+                f"(actual buffer size is {len(data)})"
+            )
+        return record_struct.iter_unpack(view)
+
+    return (
+        record_struct.unpack_from(data, offset + stride * idx) for idx in range(count)
+    )
+
+
+def _check_length(name: str, value: bytes, size: int, exact: bool = True) -> bytes:
+    """
+    Make sure `value` fits its fixed size field, since packing it would silently
+    truncate or pad it
+
+    Args:
+        name (str): Name of the field, for the error message
+        value (bytes): Data to pack into the field
+        size (int): Size of the field in bytes
+        exact (bool) = True: Set to false to allow shorter data, padded with zeros
+
+    Returns:
+        bytes: `value`, unchanged
+
+    Raises:
+        ValueError: If `value` doesn't fit the field
+    """
+    if len(value) > size or (exact and len(value) != size):
+        expected = size if exact else f"at most {size}"
+        raise ValueError(f'"{name}" is {len(value)} bytes, expected {expected}')
+    return value
+
+
+def _unique_ids(records: Iterable[Tuple[Any, ...]]) -> bool:
+    """
+    Check that no two records share the id that leads each of them
+
+    Args:
+        records (Iterable[Tuple[Any, ...]]): Unpacked records
+
+    Returns:
+        bool: True if every id is different
+    """
+    ids = [record[0] for record in records]
+    return len(set(ids)) == len(ids)
 
 
 class MDBHeader(object):
@@ -49,8 +251,10 @@ class MDBHeader(object):
         course_number (int): Number of courses contained in the file
     """
 
-    STRUCT_FORMAT = "<8biihhhhh"
-    """Binary data format. Used in `struct.unpack_from`"""
+    STRUCT_FORMAT = "<8siihhhhh"
+    """Binary data format"""
+    STRUCT = struct.Struct(STRUCT_FORMAT)
+    """Compiled :attr:`STRUCT_FORMAT`. Used to pack and unpack the header"""
     DATA_SIZE = 0x40
     """Size of the header data"""
     HEADER_FORMAT = 0x66
@@ -64,6 +268,17 @@ class MDBHeader(object):
     checksum for this data.
     """
 
+    __slots__ = (
+        "id",
+        "format",
+        "checksum",
+        "header_size",
+        "record_size",
+        "record_number",
+        "course_size",
+        "course_number",
+    )
+
     def __init__(
         self,
         id: str,
@@ -86,12 +301,21 @@ class MDBHeader(object):
 
     def to_bytearray(self) -> bytearray:
         buffer = bytearray(self.DATA_SIZE)
+        self.pack_into(buffer, 0)
+        return buffer
 
-        struct.pack_into(
-            self.STRUCT_FORMAT,
+    def pack_into(self, buffer: bytearray, offset: int) -> None:
+        """
+        Pack the binary data straight into `buffer`
+
+        Args:
+            buffer (bytearray): Buffer to write to
+            offset (int): Where in `buffer` to write the data
+        """
+        self.STRUCT.pack_into(
             buffer,
-            0,
-            *(self.id.encode("UTF-8")),
+            offset,
+            _check_length("id", self.id.encode("UTF-8"), 8),
             self.format,
             self.checksum,
             self.header_size,
@@ -101,8 +325,6 @@ class MDBHeader(object):
             self.course_size,
         )
 
-        return buffer
-
     def to_dict(self) -> Dict[str, Any]:
         """
         Convert to a dict
@@ -128,20 +350,20 @@ class MDBHeader(object):
         Returns:
             :class:`lxml.etree`: Music DB Header as XML tree
         """
-        return E.header(
-            E.data(
-                _xe(
-                    "id", " ".join(map(str, bytearray(self.id, "UTF-8"))), "s8", count=8
-                ),
-                _xe("format", self.format, "s32"),
-                _xe("chksum", self.checksum, "s32"),
-                _xe("header_sz", self.header_size, "s16"),
-                _xe("record_sz", self.record_size, "s16"),
-                _xe("record_nr", self.record_number, "s16"),
-                _xe("course_sz", self.course_size, "s16"),
-                _xe("course_nr", self.course_number, "s16"),
-            )
-        )
+        etree = _etree()
+
+        header = etree.Element("header")
+        data = etree.SubElement(header, "data")
+        id = " ".join(map(str, bytearray(self.id, "UTF-8")))
+        _xe("id", id, "s8", count=8, parent=data)
+        _xe("format", self.format, "s32", parent=data)
+        _xe("chksum", self.checksum, "s32", parent=data)
+        _xe("header_sz", self.header_size, "s16", parent=data)
+        _xe("record_sz", self.record_size, "s16", parent=data)
+        _xe("record_nr", self.record_number, "s16", parent=data)
+        _xe("course_sz", self.course_size, "s16", parent=data)
+        _xe("course_nr", self.course_number, "s16", parent=data)
+        return header
 
     def __repr__(self) -> str:
         return (
@@ -179,7 +401,7 @@ class MDBHeader(object):
         Returns:
             :class:`.MDBHeader`: Header object
         """
-        id = bytes(data[0:8]).decode("UTF-8")
+        id = data[0].decode("UTF-8")
         (
             format,
             checksum,
@@ -188,7 +410,7 @@ class MDBHeader(object):
             record_number,
             course_number,
             course_size,
-        ) = data[8:]
+        ) = data[1:]
 
         return MDBHeader(
             id,
@@ -213,6 +435,8 @@ class MDBDifficulty(object):
         extreme (int): Extreme Difficulty Value
     """
 
+    __slots__ = ("beginner", "basic", "advanced", "extreme")
+
     def __init__(self, beginner: int, basic: int, advanced: int, extreme: int) -> None:
         self.beginner = beginner
         self.basic = basic
@@ -260,27 +484,43 @@ class MDBDifficulty(object):
 
 class MDBDifficultyList(object):
     """
-    Holds all the different :class:`.MDBDifficulty` objects for each instrument. Guitar,
-    Bass, Open, and Drum.
+    Holds the difficulty values for each instrument. Guitar, Bass, Open, and Drum.
+
+    The values are kept as the raw 16 bytes from `mdbe.bin`, and the
+    :class:`.MDBDifficulty` for an instrument is only created when it's asked for.
 
     Args:
-        guitar (:class:`.MDBDifficuly`): Guitar Difficulty
-        bass (:class:`.MDBDifficuly`): Bass Difficulty
-        open_pick (:class:`.MDBDifficuly`): Open Difficulty
-        drum (:class:`.MDBDifficuly`): Drum Difficulty
+        values (bytes): Beginner, Basic, Advanced, and Extreme difficulty values for
+            Guitar, Bass, Open, and Drum in that order
     """
 
-    def __init__(
-        self,
-        guitar: MDBDifficulty,
-        bass: MDBDifficulty,
-        open_pick: MDBDifficulty,
-        drum: MDBDifficulty,
-    ) -> None:
-        self.guitar = guitar
-        self.bass = bass
-        self.open_pick = open_pick
-        self.drum = drum
+    INSTRUMENTS = (("guitar", 0), ("bass", 4), ("open", 8), ("drum", 12))
+    """Name of each instrument in the JSON data, and where its values start"""
+
+    __slots__ = ("values",)
+
+    def __init__(self, values: bytes) -> None:
+        self.values = values
+
+    @property
+    def guitar(self) -> MDBDifficulty:
+        """:class:`.MDBDifficulty`: Guitar Difficulty"""
+        return MDBDifficulty(*self.values[0:4])
+
+    @property
+    def bass(self) -> MDBDifficulty:
+        """:class:`.MDBDifficulty`: Bass Difficulty"""
+        return MDBDifficulty(*self.values[4:8])
+
+    @property
+    def open_pick(self) -> MDBDifficulty:
+        """:class:`.MDBDifficulty`: Open Difficulty"""
+        return MDBDifficulty(*self.values[8:12])
+
+    @property
+    def drum(self) -> MDBDifficulty:
+        """:class:`.MDBDifficulty`: Drum Difficulty"""
+        return MDBDifficulty(*self.values[12:16])
 
     def to_dict(self) -> Dict[str, Any]:
         """
@@ -289,34 +529,55 @@ class MDBDifficultyList(object):
         Returns:
             Dict[str, Any]: Difficulty List as a dict
         """
+        # Build the dicts straight from the raw values rather than going through a
+        # temporary MDBDifficulty for each instrument
+        values = self.values
         return {
-            "guitar": self.guitar.to_dict(),
-            "bass": self.bass.to_dict(),
-            "open": self.open_pick.to_dict(),
-            "drum": self.drum.to_dict(),
+            instrument: {
+                "beginner": values[idx],
+                "basic": values[idx + 1],
+                "advanced": values[idx + 2],
+                "extreme": values[idx + 3],
+            }
+            for instrument, idx in self.INSTRUMENTS
         }
 
-    def to_xml(self) -> etree:
+    def str_values(self) -> str:
+        """
+        Convert to a string
+
+        Returns:
+            str: A space delimited string of all 16 difficulty values
+        """
+        return " ".join([_U8_STRS[value] for value in self.values])
+
+    def to_xml(self, parent: Optional[etree] = None) -> etree:
         """
         Convert to an XML tree
 
+        Args:
+            parent (Optional[:class:`lxml.etree`]) = None: Element to add the difficulty
+                list to
+
         Returns:
             :class:`lxml.etree`: Difficulty List as XML tree
         """
-        body = (
-            f"{self.guitar.str_values()} {self.bass.str_values()} "
-            f"{self.open_pick.str_values()} {self.drum.str_values()}"
+        return _xe(
+            "classics_diff_list", self.str_values(), "u8", count=16, parent=parent
         )
-        return _xe("classics_diff_list", body, "u8", count=16)
 
     @classmethod
     def from_json(cls, data: Dict[Any, Any]) -> MDBDifficultyList:
-        return MDBDifficultyList(
-            MDBDifficulty.from_json(data["guitar"]),
-            MDBDifficulty.from_json(data["bass"]),
-            MDBDifficulty.from_json(data["open"]),
-            MDBDifficulty.from_json(data["drum"]),
-        )
+        values: List[int] = []
+        for instrument, _ in cls.INSTRUMENTS:
+            difficulty = data[instrument]
+            values += (
+                difficulty["beginner"],
+                difficulty["basic"],
+                difficulty["advanced"],
+                difficulty["extreme"],
+            )
+        return MDBDifficultyList(bytes(values))
 
     def __repr__(self) -> str:
         return (
@@ -350,7 +611,7 @@ class MDBSong(object):
         life (int): Unknown
         gf_offset (int): Unknown
         dm_offset (int): Unknown
-        chart_list (List[int]): Unknown
+        chart_list (bytes): Unknown
         origin: (int): Unknown (Version of the game it came out on?)
         music_type (int): Unknown
         genre (int): Unknown (some sort of genre sort?)
@@ -360,7 +621,7 @@ class MDBSong(object):
     STRUCT_FORMAT = (
         "<"
         "i"  # music_id
-        "16B"  # diff_list
+        "16s"  # diff_list
         "B"  # seq_flag
         "B"  # pad_diff
         "2B"  # contain_stat
@@ -369,7 +630,7 @@ class MDBSong(object):
         "B"  # b_eemail
         "H"  # bpm
         "H"  # bpm2
-        "16B"  # title_ascii
+        "16s"  # title_ascii
         "H"  # order_ascii
         "H"  # order_kana
         "B"  # category_kana
@@ -379,15 +640,79 @@ class MDBSong(object):
         "B"  # life
         "b"  # gf_offset
         "b"  # dm_offset
-        "128B"  # chart_list
+        "128s"  # chart_list
         "B"  # origin
         "B"  # music_type
         "B"  # genre
         "B"  # is_remaster
     )
-    """Binary data format. Used in `struct.unpack_from`"""
+    """Binary data format"""
+    STRUCT = struct.Struct(STRUCT_FORMAT)
+    """Compiled :attr:`STRUCT_FORMAT`. Used to pack and unpack song records"""
     DATA_SIZE = 0xC0
     """Size of Song Data"""
+    XML_TEMPLATE = _xml_template(
+        "mdb_data",
+        (
+            ("music_id", "s32", 1),
+            ("classics_diff_list", "u8", 16),
+            ("seq_flag", "u16", 1),
+            ("pad_diff", "u16", 1),
+            ("contain_stat", "u8", 2),
+            ("first_classic_ver", "u8", 2),
+            ("b_long", "bool", 1),
+            ("b_eemall", "bool", 1),
+            ("bpm", "u16", 1),
+            ("bpm2", "u16", 1),
+            ("title_ascii", "str", 1),
+            ("order_ascii", "u16", 1),
+            ("order_kana", "u16", 1),
+            ("category_kana", "s8", 1),
+            ("secret", "u8", 2),
+            ("b_session", "u8", 1),
+            ("speed", "u8", 1),
+            ("life", "u8", 1),
+            ("gf_ofst", "s8", 1),
+            ("dm_ofst", "s8", 1),
+            ("chart_list", "u8", 128),
+            ("origin", "u8", 1),
+            ("music_type", "u8", 1),
+            ("genre", "u8", 1),
+            ("is_remaster", "u8", 1),
+        ),
+    )
+    """
+    Template of the `mdb_data` element. Filling it in and parsing it is much quicker
+    than building each child element separately.
+    """
+
+    __slots__ = (
+        "music_id",
+        "difficulty",
+        "seq_flag",
+        "pad_diff",
+        "contain_stat",
+        "first_ver",
+        "b_long",
+        "b_eemall",
+        "bpm",
+        "bpm2",
+        "title_ascii",
+        "order_ascii",
+        "order_kana",
+        "category_kana",
+        "secret",
+        "b_session",
+        "speed",
+        "life",
+        "gf_offset",
+        "dm_offset",
+        "chart_list",
+        "origin",
+        "music_type",
+        "genre",
+        "is_remaster",
+    )
 
     def __init__(
         self,
@@ -411,7 +736,7 @@ class MDBSong(object):
         life: int,
         gf_offset: int,
         dm_offset: int,
-        chart_list: List[int],
+        chart_list: bytes,
         origin: int,
         music_type: int,
         genre: int,
@@ -445,33 +770,22 @@ class MDBSong(object):
 
     def to_bytearray(self) -> bytearray:
         buffer = bytearray(self.DATA_SIZE)
+        self.pack_into(buffer, 0)
+        return buffer
 
-        title_diff = 16 - len(self.title_ascii)
-        zero_fill = [0 for x in range(0, title_diff)]
-        new_title = bytearray(self.title_ascii.encode("UTF-8")).copy()
-        new_title.extend(zero_fill)
+    def pack_into(self, buffer: bytearray, offset: int) -> None:
+        """
+        Pack the binary data straight into `buffer`
 
-        struct.pack_into(
-            self.STRUCT_FORMAT,
+        Args:
+            buffer (bytearray): Buffer to write to
+            offset (int): Where in `buffer` to write the data
+        """
+        self.STRUCT.pack_into(
             buffer,
-            0,
+            offset,
             self.music_id,
-            self.difficulty.guitar.beginner,
-            self.difficulty.guitar.basic,
-            self.difficulty.guitar.advanced,
-            self.difficulty.guitar.extreme,
-            self.difficulty.bass.beginner,
-            self.difficulty.bass.basic,
-            self.difficulty.bass.advanced,
-            self.difficulty.bass.extreme,
-            self.difficulty.open_pick.beginner,
-            self.difficulty.open_pick.basic,
-            self.difficulty.open_pick.advanced,
-            self.difficulty.open_pick.extreme,
-            self.difficulty.drum.beginner,
-            self.difficulty.drum.basic,
-            self.difficulty.drum.advanced,
-            self.difficulty.drum.extreme,
+            self.difficulty.values,
             self.seq_flag,
             self.pad_diff,
             *self.contain_stat,
@@ -480,7 +794,7 @@ class MDBSong(object):
             0x1 if self.b_eemall else 0x0,
             self.bpm,
             self.bpm2,
-            *new_title,
+            _check_length("title_ascii", self.title_ascii.encode("UTF-8"), 16, False),
             self.order_ascii,
             self.order_kana,
             self.category_kana,
@@ -490,15 +804,13 @@ class MDBSong(object):
             self.life,
             self.gf_offset,
             self.dm_offset,
-            *self.chart_list,
+            _check_length("chart_list", bytes(self.chart_list), 128),
             self.origin,
             self.music_type,
             self.genre,
             self.is_remaster,
         )
 
-        return buffer
-
     @classmethod
     def from_json(cls, data: Dict[Any, Any]) -> MDBSong:
         return MDBSong(
@@ -522,7 +834,7 @@ class MDBSong(object):
             data["life"],
             data["gf_offset"],
             data["dm_offset"],
-            data["chart_list"],
+            bytes(data["chart_list"]),
             data["origin"],
             data["music_type"],
             data["genre"],
@@ -540,71 +852,81 @@ class MDBSong(object):
         Returns:
             :class:`.MDBSong`: Song object
         """
-        # First just split up the tuple in to the different sections
-        music_id = data[0]
-        diff_list = data[1:17]
-        seq_flag = data[17]
-        pad_diff = data[18]
-        contain_stat = data[19:21]
-        first_ver = data[21:23]
-        b_long = data[23]
-        b_eemall = data[24]
-        bpm = data[25]
-        bpm2 = data[26]
-        title_ascii = data[27:43]
-        order_ascii = data[43]
-        order_kana = data[44]
-        category_kana = data[45]
-        secret = data[46:48]
-        b_session = data[48]
-        speed = data[49]
-        life = data[50]
-        gf_offset = data[51]
-        dm_offset = data[52]
-        chart_list = data[53:181]
-        origin = data[181]
-        music_type = data[182]
-        genre = data[183]
-        is_remaster = data[184]
-
-        # Create a proper difficulty object
-        difficulty = MDBDifficultyList(
-            MDBDifficulty(*diff_list[0:4]),
-            MDBDifficulty(*diff_list[4:8]),
-            MDBDifficulty(*diff_list[8:12]),
-            MDBDifficulty(*diff_list[12:16]),
-        )
-
-        title_ascii = tuple([a for a in title_ascii if a != 0])
+        # Unpack the whole tuple in one go rather than indexing and slicing it
+        (
+            music_id,
+            diff_list,
+            seq_flag,
+            pad_diff,
+            contain_stat0,
+            contain_stat1,
+            first_ver0,
+            first_ver1,
+            b_long,
+            b_eemall,
+            bpm,
+            bpm2,
+            title_ascii,
+            order_ascii,
+            order_kana,
+            category_kana,
+            secret0,
+            secret1,
+            b_session,
+            speed,
+            life,
+            gf_offset,
+            dm_offset,
+            chart_list,
+            origin,
+            music_type,
+            genre,
+            is_remaster,
+        ) = data
 
         return MDBSong(
             music_id,
-            difficulty,
+            MDBDifficultyList(diff_list),
             seq_flag,
             pad_diff,
-            (contain_stat[0], contain_stat[1]),
-            (first_ver[0], first_ver[1]),
-            True if b_long == 1 else False,
-            True if b_eemall == 1 else False,
+            (contain_stat0, contain_stat1),
+            (first_ver0, first_ver1),
+            b_long == 1,
+            b_eemall == 1,
             bpm,
             bpm2,
-            bytes(title_ascii).decode("UTF-8"),
+            title_ascii.replace(b"\x00", b"").decode("UTF-8"),
             order_ascii,
             order_kana,
             category_kana,
-            (secret[0], secret[1]),
+            (secret0, secret1),
             b_session,
             speed,
             life,
             gf_offset,
             dm_offset,
-            list(chart_list),
+            chart_list,
             origin,
             music_type,
             genre,
             is_remaster,
         )
 
+    def printable_title(self) -> str:
+        """
+        Get the title with anything that isn't printable ASCII stripped out
+
+        Returns:
+            str: Printable version of `title_ascii`
+        """
+        # Non ASCII characters encode to bytes above 0x7F, so deleting the non printable
+        # bytes drops them too
+        return (
+            self.title_ascii.encode("UTF-8")
+            .translate(None, _NON_PRINTABLE)
+            .decode("ASCII")
+        )
+
     def to_dict(self) -> dict:
         """
         Convert to a dict
@@ -623,7 +945,7 @@ class MDBSong(object):
             "b_eemall": self.b_eemall,
             "bpm": self.bpm,
             "bpm2": self.bpm2,
-            "title_ascii": "".join(i for i in self.title_ascii if 31 < ord(i) < 127),
+            "title_ascii": self.printable_title(),
             "order_ascii": self.order_ascii,
             "order_kana": self.order_kana,
             "category_kana": self.category_kana,
@@ -633,7 +955,7 @@ class MDBSong(object):
             "life": self.life,
             "gf_offset": self.gf_offset,
             "dm_offset": self.dm_offset,
-            "chart_list": self.chart_list,
+            "chart_list": list(self.chart_list),
             "origin": self.origin,
             "music_type": self.music_type,
             "genre": self.genre,
@@ -647,38 +969,46 @@ class MDBSong(object):
         Returns:
             :class:`lxml.etree`: Music DB Song as XML tree
         """
-        return E.mdb_data(
-            _xe("music_id", self.music_id, "s32"),
-            self.difficulty.to_xml(),
-            _xe("seq_flag", self.seq_flag, "u16"),
-            _xe("pad_diff", self.pad_diff, "u16"),
-            _xe("contain_stat", " ".join(map(str, self.contain_stat)), "u8", count=2),
-            _xe("first_classic_ver", " ".join(map(str, self.first_ver)), "u8", count=2),
-            _xe("b_long", "1" if self.b_long else "0", "bool"),
-            _xe("b_eemall", "1" if self.b_eemall else "0", "bool"),
-            _xe("bpm", self.bpm, "u16"),
-            _xe("bpm2", self.bpm2, "u16"),
-            _xe(
-                "title_ascii",
-                "".join(i for i in self.title_ascii if 31 < ord(i) < 127),
-                "str",
-            ),
-            _xe("order_ascii", self.order_ascii, "u16"),
-            _xe("order_kana", self.order_kana, "u16"),
-            _xe("category_kana", self.category_kana, "s8"),
-            _xe("secret", " ".join(map(str, self.secret)), "u8", count=2),
-            _xe("b_session", self.b_session, "u8"),
-            _xe("speed", self.speed, "u8"),
-            _xe("life", self.life, "u8"),
-            _xe("gf_ofst", self.gf_offset, "s8"),
-            _xe("dm_ofst", self.dm_offset, "s8"),
-            _xe("chart_list", " ".join(map(str, self.chart_list)), "u8", count=128),
-            _xe("origin", self.origin, "u8"),
-            _xe("music_type", self.music_type, "u8"),
-            _xe("genre", self.genre, "u8"),
-            _xe("is_remaster", self.is_remaster, "u8"),
+        etree = _etree()
+
+        title_ascii = self.printable_title()
+        element = etree.fromstring(
+            self.XML_TEMPLATE.format(
+                self.music_id,
+                self.difficulty.str_values(),
+                self.seq_flag,
+                self.pad_diff,
+                " ".join(map(str, self.contain_stat)),
+                " ".join(map(str, self.first_ver)),
+                "1" if self.b_long else "0",
+                "1" if self.b_eemall else "0",
+                self.bpm,
+                self.bpm2,
+                _xml_escape(title_ascii),
+                self.order_ascii,
+                self.order_kana,
+                self.category_kana,
+                " ".join(map(str, self.secret)),
+                self.b_session,
+                self.speed,
+                self.life,
+                self.gf_offset,
+                self.dm_offset,
+                " ".join([_U8_STRS[value] for value in self.chart_list]),
+                self.origin,
+                self.music_type,
+                self.genre,
+                self.is_remaster,
+            )
         )
 
+        # The parser leaves empty elements without any text, keep the empty title as an
+        # empty string so it serializes the same as the other elements
+        if not title_ascii:
+            element[10].text = ""
+
+        return element
+
     def __repr__(self) -> str:
         return (
             f"MDBSong<music_id: {self.music_id}, difficulty: {self.difficulty}, "
@@ -690,7 +1020,7 @@ class MDBSong(object):
             f"category_kana: {self.category_kana}, secret: {self.secret}, "
             f"b_session: {self.b_session}, speed: {self.speed}, "
             f"life: {self.life}, gf_offset: {self.gf_offset}, "
-            f"dm_offset: {self.dm_offset}, chart_list: {self.chart_list}, "
+            f"dm_offset: {self.dm_offset}, chart_list: {list(self.chart_list)}, "
             f"origin: {self.origin}, music_type: {self.music_type}, "
             f"genre: {self.genre}, is_remaster: {self.is_remaster}>"
         )
@@ -709,11 +1039,15 @@ class MDBCourse(object):
         difficulty (:class:`.MDBDifficultyList`): Difficulty list for the course
     """
 
-    STRUCT_FORMAT = "<iI4i16B"
-    """Binary data format. Used in `struct.unpack_from`"""
+    STRUCT_FORMAT = "<iI4i16s"
+    """Binary data format"""
+    STRUCT = struct.Struct(STRUCT_FORMAT)
+    """Compiled :attr:`STRUCT_FORMAT`. Used to pack and unpack course records"""
     DATA_SIZE = 0x28
     """Size of the course data"""
 
+    __slots__ = ("course_id", "course_flag", "music_ids", "difficulty")
+
     def __init__(
         self,
         course_id: int,
@@ -734,34 +1068,26 @@ class MDBCourse(object):
 
     def to_bytearray(self) -> bytearray:
         buffer = bytearray(self.DATA_SIZE)
+        self.pack_into(buffer, 0)
+        return buffer
+
+    def pack_into(self, buffer: bytearray, offset: int) -> None:
+        """
+        Pack the binary data straight into `buffer`
 
-        struct.pack_into(
-            self.STRUCT_FORMAT,
+        Args:
+            buffer (bytearray): Buffer to write to
+            offset (int): Where in `buffer` to write the data
+        """
+        self.STRUCT.pack_into(
             buffer,
-            0,
+            offset,
             self.course_id,
             self.course_flag,
             *self.music_ids,
-            self.difficulty.guitar.beginner,
-            self.difficulty.guitar.basic,
-            self.difficulty.guitar.advanced,
-            self.difficulty.guitar.extreme,
-            self.difficulty.bass.beginner,
-            self.difficulty.bass.basic,
-            self.difficulty.bass.advanced,
-            self.difficulty.bass.extreme,
-            self.difficulty.open_pick.beginner,
-            self.difficulty.open_pick.basic,
-            self.difficulty.open_pick.advanced,
-            self.difficulty.open_pick.extreme,
-            self.difficulty.drum.beginner,
-            self.difficulty.drum.basic,
-            self.difficulty.drum.advanced,
-            self.difficulty.drum.extreme,
+            self.difficulty.values,
         )
 
-        return buffer
-
     def to_dict(self) -> Dict[str, Any]:
         """
         Convert to a dict
@@ -783,12 +1109,15 @@ class MDBCourse(object):
         Returns:
             :class:`lxml.etree`: Music DB Course as XML tree
         """
-        return E.mdb_course(
-            _xe("course_id", self.course_id, "s32"),
-            _xe("course_flag", self.course_flag, "u32"),
-            _xe("music_id", " ".join(map(str, self.music_ids)), "s32", count=4),
-            self.difficulty.to_xml(),
-        )
+        etree = _etree()
+
+        course = etree.Element("mdb_course")
+        _xe("course_id", self.course_id, "s32", parent=course)
+        _xe("course_flag", self.course_flag, "u32", parent=course)
+        music_ids = " ".join(map(str, self.music_ids))
+        _xe("music_id", music_ids, "s32", count=4, parent=course)
+        self.difficulty.to_xml(parent=course)
+        return course
 
     @classmethod
     def from_json(cls, data: Dict[Any, Any]) -> MDBCourse:
@@ -812,15 +1141,9 @@ class MDBCourse(object):
         """
         course_id, course_flag = data[0:2]
         music_ids = data[2:6]
-        diff_list = data[6:]
-
-        # Create a proper difficulty object
-        difficulty = MDBDifficultyList(
-            MDBDifficulty(*diff_list[0:4]),
-            MDBDifficulty(*diff_list[4:8]),
-            MDBDifficulty(*diff_list[8:12]),
-            MDBDifficulty(*diff_list[12:16]),
-        )
+        diff_list = data[6]
+
+        difficulty = MDBDifficultyList(diff_list)
 
         return MDBCourse(course_id, course_flag, list(music_ids), difficulty)
 
@@ -841,6 +1164,9 @@ class MDB(object):
     ENCRYPTION_KEY = [0x32, 0x2B, 0x2E, 0x35, 0x38, 0x3E, 0x3B, 0x2E, 0x41]
     """Part of the decryption process"""
 
+    KEY_STREAM = _key_stream(ENCRYPTION_KEY)
+    """One period of the key stream XORed with the data, derived from ENCRYPTION_KEY"""
+
     IDENTIFIER = "GF/DMmdb"
     """Identifier in the header of the file"""
 
@@ -857,8 +1183,6 @@ class MDB(object):
         self.decrypted_data: Optional[bytearray] = None
         self.pretty_print = pretty_print
         self.header: Optional[MDBHeader] = None
-        self.songs: Dict[int, MDBSong] = {}
-        self.courses: Dict[int, MDBCourse] = {}
 
         if self.input_path.suffix.lower() == ".json":
             self.rich_import()
@@ -867,7 +1191,7 @@ class MDB(object):
             self.build()
 
     def apply_encryption_key(
-        self, buffer: Optional[bytearray], decrypt: bool = True
+        self, buffer: Optional[Union[bytes, bytearray, mmap.mmap]], decrypt: bool = True
     ) -> bytearray:
         """
         Apply the ENCRYPTION KEY to the raw data to decrypt, or apply it to the
@@ -880,24 +1204,8 @@ class MDB(object):
             logger.error("Buffer is None, can not apply encryption key")
             return bytearray(0)
 
-        bufflen = len(buffer)
-
-        # Allocate an output buffer and then decrypt/encrypt into the output buffer
-        output_buffer = bytearray(bufflen)
-
-        for idx in range(0, bufflen):
-            in_idx = bufflen - 1 - idx if decrypt else idx
-            out_idx = idx if decrypt else bufflen - 1 - idx
-
-            byte = buffer[in_idx] ^ (
-                idx
-                + 16 * (idx % 8)
-                + (self.ENCRYPTION_KEY[idx % 9] ^ (9 * (idx // 9) - idx + 127))
-                - 9 * (idx // 9)
-            )
-
-            output_buffer[out_idx] = byte
-        return output_buffer
+        # Decrypting reads the input back to front, encrypting writes it back to front
+        return pakdec.apply_key_stream(buffer, self.KEY_STREAM, decrypt)
 
     def decrypt(self) -> bytearray:
         """
@@ -906,9 +1214,17 @@ class MDB(object):
         Returns:
             bytearray: Decrypted data
         """
-        # Read the file into memory
-        input_buffer = bytearray(self.input_path.open("rb").read())
-        return self.apply_encryption_key(input_buffer)
+        # The key stream is applied into a new buffer and the input is only ever read,
+        # so map the file instead of copying it into memory first
+        with self.input_path.open("rb") as f:
+            try:
+                input_buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # Empty files can't be mapped, and there is nothing to decrypt anyway
+                return bytearray(0)
+
+        with input_buffer:
+            return self.apply_encryption_key(input_buffer)
 
     def encrypt(self) -> Optional[bytearray]:
         """
@@ -933,8 +1249,7 @@ class MDB(object):
             return None
 
         # Read in header
-        raw_header_data = data[0 : MDBHeader.DATA_SIZE]
-        header_data = struct.unpack_from(MDBHeader.STRUCT_FORMAT, raw_header_data)
+        header_data = MDBHeader.STRUCT.unpack_from(data, 0)
         self.header = MDBHeader.from_byte_data(header_data)
 
         # Make sure the type is correct
@@ -944,41 +1259,112 @@ class MDB(object):
                 f'match expected identifier "{self.IDENTIFIER}"'
             )
 
-        # Grab the song data
+    @cached_property
+    def songs(self) -> Dict[int, MDBSong]:
+        """
+        Every song keyed by its music id, built from the decrypted data the first time
+        it's asked for. Later songs with a repeated id replace earlier ones
+        """
+        return {song.music_id: song for song in self.iter_songs()}
+
+    @cached_property
+    def courses(self) -> Dict[int, MDBCourse]:
+        """
+        Every course keyed by its course id, built from the decrypted data the first
+        time it's asked for. Later courses with a repeated id replace earlier ones
+        """
+        return {course.course_id: course for course in self.iter_courses()}
+
+    def iter_songs(self) -> Iterator[MDBSong]:
+        """
+        Lazily build the song objects from the decrypted data, one record at a time
+
+        Yields:
+            :class:`.MDBSong`: Each song in the order they appear in the data
+        """
+        for record in self.song_records():
+            yield MDBSong.from_byte_data(record)
+
+    def iter_courses(self) -> Iterator[MDBCourse]:
+        """
+        Lazily build the course objects from the decrypted data, one record at a time
+
+        Yields:
+            :class:`.MDBCourse`: Each course in the order they appear in the data
+        """
+        for record in self.course_records():
+            yield MDBCourse.from_byte_data(record)
+
+    def song_records(self) -> Iterator[Tuple[Any, ...]]:
+        """
+        Unpack the raw song records from the decrypted data
+
+        Returns:
+            Iterator[Tuple[Any, ...]]: Each unpacked song record
+        """
+        data = self.decrypted_data
+        if data is None or self.header is None:
+            return iter(())
+
         # The song data size is actually 4 bytes bigger than the header would suggest
         song_data_size = self.header.record_size + 0x04
 
-        count = 0
-        start_point = MDBHeader.DATA_SIZE
-        while count < self.header.record_number:
-            idx_start = start_point + (song_data_size * count)
-            idx_end = idx_start + song_data_size
+        return _unpack_records(
+            MDBSong.STRUCT,
+            data,
+            MDBHeader.DATA_SIZE,
+            song_data_size,
+            self.header.record_number,
+        )
 
-            raw_song_data = data[idx_start:idx_end]
-            song_data = struct.unpack_from(MDBSong.STRUCT_FORMAT, raw_song_data)
-            song = MDBSong.from_byte_data(song_data)
-            self.songs[song.music_id] = song
+    def course_records(self) -> Iterator[Tuple[Any, ...]]:
+        """
+        Unpack the raw course records from the decrypted data
 
-            count += 1
+        Returns:
+            Iterator[Tuple[Any, ...]]: Each unpacked course record
+        """
+        data = self.decrypted_data
+        if data is None or self.header is None:
+            return iter(())
 
-        # Grab the course data
-        # The course data size is actually 4 bytes bigger than the header would suggest
+        # The course data follows straight on from the song data. Both are actually 4
+        # bytes bigger than the header would suggest
+        song_data_size = self.header.record_size + 0x04
         course_data_size = self.header.course_size + 0x04
 
-        count = 0
-        start_point = MDBHeader.DATA_SIZE + (
-            song_data_size * (self.header.record_number)
+        return _unpack_records(
+            MDBCourse.STRUCT,
+            data,
+            MDBHeader.DATA_SIZE + song_data_size * self.header.record_number,
+            course_data_size,
+            self.header.course_number,
         )
-        while count < self.header.course_number:
-            idx_start = start_point + (course_data_size * count)
-            idx_end = idx_start + course_data_size
 
-            raw_course_data = data[idx_start:idx_end]
-            course_data = struct.unpack_from(MDBCourse.STRUCT_FORMAT, raw_course_data)
-            course = MDBCourse.from_byte_data(course_data)
-            self.courses[course.course_id] = course
+    def export_songs(self) -> Iterable[MDBSong]:
+        """
+        The songs to export. Unless :attr:`songs` has already been built they are
+        streamed from the decrypted data, so every song object never has to be alive at
+        once. Repeated ids fall back to :attr:`songs` so only the last one is exported
+
+        Returns:
+            Iterable[:class:`.MDBSong`]: Each song to export
+        """
+        if "songs" in self.__dict__ or not _unique_ids(self.song_records()):
+            return self.songs.values()
+        return self.iter_songs()
+
+    def export_courses(self) -> Iterable[MDBCourse]:
+        """
+        The courses to export, streamed from the decrypted data the same way as
+        :meth:`export_songs`
 
-            count += 1
+        Returns:
+            Iterable[:class:`.MDBCourse`]: Each course to export
+        """
+        if "courses" in self.__dict__ or not _unique_ids(self.course_records()):
+            return self.courses.values()
+        return self.iter_courses()
 
     def rich_import(self, import_type: str = "JSON") -> None:
         """
@@ -989,10 +1375,8 @@ class MDB(object):
             import_type (str) = "JSON": Choose between "XML" and "JSON" for input type
 
         """
-        with self.input_path.open() as f:
-            jdata = json.load(f)
-
-            mdb = jdata["musicdb"]
+        jdata = _json_loads(self.input_path.read_bytes())
+        mdb = jdata["musicdb"]
 
         # import songs
         for key, value in mdb["songs"].items():
@@ -1034,17 +1418,23 @@ class MDB(object):
         if self.header is None:
             return bytearray(0)
 
-        buffer = bytearray()
+        # Allocate the whole file up front and pack every record straight into it
+        buffer = bytearray(
+            MDBHeader.DATA_SIZE
+            + MDBSong.DATA_SIZE * len(self.songs)
+            + MDBCourse.DATA_SIZE * len(self.courses)
+        )
 
-        buffer += self.header.to_bytearray()
+        self.header.pack_into(buffer, 0)
+        offset = MDBHeader.DATA_SIZE
 
-        for k in self.songs:
-            song = self.songs[k]
-            buffer += song.to_bytearray()
+        for song in self.songs.values():
+            song.pack_into(buffer, offset)
+            offset += MDBSong.DATA_SIZE
 
-        for k in self.courses:
-            course = self.courses[k]
-            buffer += course.to_bytearray()
+        for course in self.courses.values():
+            course.pack_into(buffer, offset)
+            offset += MDBCourse.DATA_SIZE
 
         return buffer
 
@@ -1061,45 +1451,75 @@ class MDB(object):
             Exception: If header is emtpy
             Exception: If export format is unknown
         """
-        if export_type == "JSON":
-            header = self.header.to_dict() if self.header is not None else ""
-            output: Dict[str, Any] = {
-                "musicdb": {"header": header, "songs": {}, "courses": {}}
-            }
-            for key, song in self.songs.items():
-                output["musicdb"]["songs"][song.music_id] = song.to_dict()
-            for key, course in self.courses.items():
-                output["musicdb"]["courses"][course.course_id] = course.to_dict()
-
-            # str_output: str
-            if self.pretty_print:
-                str_output = json.dumps(output, indent=2).encode("UTF-8")
-            else:
-                str_output = json.dumps(output).encode("UTF-8")
-        elif export_type == "XML":
-            if self.header is None:
-                raise Exception("Header is empty, could not print")
-
-            root = E.mdb(
-                self.header.to_xml(),
-                *[self.songs[k].to_xml() for k in self.songs],
-                *[self.courses[k].to_xml() for k in self.courses],
-            )
-            str_output = etree.tostring(
-                root,
-                xml_declaration=True,
-                encoding="UTF-8",
-                pretty_print=self.pretty_print,
-            )
-        else:
+        if export_type not in ("JSON", "XML"):
             raise Exception(f"Unknown export format: {export_type}")
+        if export_type == "XML" and self.header is None:
+            raise Exception("Header is empty, could not print")
 
-        # Write output file
+        # Check the output file first so nothing is serialized if it won't be written
         filepath = self.output_path / f"mdb.{export_type.lower()}"
-        if not filepath.exists() or self.force:
-            print(f"Writing: {filepath}")
-            filepath.open("wb").write(str_output)
-        else:
+        if filepath.exists() and not self.force:
             logger.error(
                 f'File "{filepath}" not written. Please use `-f` to overwrite it'
             )
+            return
+
+        print(f"Writing: {filepath}")
+        if export_type == "XML":
+            self.write_xml(filepath)
+            return
+
+        header = self.header.to_dict() if self.header is not None else ""
+        output: Dict[str, Any] = {
+            "musicdb": {
+                "header": header,
+                "songs": {
+                    song.music_id: song.to_dict() for song in self.export_songs()
+                },
+                "courses": {
+                    course.course_id: course.to_dict()
+                    for course in self.export_courses()
+                },
+            }
+        }
+
+        with filepath.open("wb") as f:
+            f.write(_json_dumps(output, self.pretty_print))
+
+    def write_xml(self, filepath: Path) -> None:
+        """
+        Write the music db out as XML, serializing one element at a time so the whole
+        document never has to be held in memory.
+
+        Args:
+            filepath (Path): File to write the XML to
+
+        Raises:
+            Exception: If header is emtpy
+        """
+        etree = _etree()
+
+        if self.header is None:
+            raise Exception("Header is empty, could not print")
+
+        elements = chain(
+            (self.header.to_xml(),),
+            (song.to_xml() for song in self.export_songs()),
+            (course.to_xml() for course in self.export_courses()),
+        )
+
+        with filepath.open("wb") as f:
+            with etree.xmlfile(f, encoding="UTF-8") as xf:
+                xf.write_declaration()
+                with xf.element("mdb"):
+                    for element in elements:
+                        if self.pretty_print:
+                            # Lay each element out the same way pretty printing the
+                            # whole document at once would
+                            etree.indent(element, space="  ", level=1)
+                            xf.write("\n  ")
+                        xf.write(element)
+                    if self.pretty_print:
+                        xf.write("\n")
+            if self.pretty_print:
+                f.write(b"\n")
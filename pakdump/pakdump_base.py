@@ -1,11 +1,12 @@
 import argparse
 import logging
+import os
 from pathlib import Path
 from typing import Optional, Sequence
 
 from pakdump.dumper import PakDumper
 from pakdump.filegen import DEFAULT_FILELIST_PATH, load_filelist
-from pakdump.utils.ap import FullDirPath, FullPath
+from pakdump.utils.ap import FullDirPath, FullPath, make_base_parser, positive_int
 
 
 logger = logging.getLogger(__name__)
@@ -27,31 +28,34 @@ def main(args: Optional[Sequence[str]] = None) -> None:
     )
 
     # Create a dumper object, and dump the data
-    dumper = PakDumper(p_args.input, p_args.output, p_args.force)
+    dumper = PakDumper(
+        p_args.input,
+        p_args.output,
+        p_args.force,
+        jobs=p_args.jobs,
+        verify=p_args.verify,
+    )
 
     if p_args.test_filepath != []:
-        for filepath in p_args.test_filepath:
-            exists = dumper.file_exists(filepath)
-
+        results = dumper.files_exist(p_args.test_filepath)
+        for filepath, exists in zip(p_args.test_filepath, results):
             if exists:
                 print(f"Filepath exists: {filepath}")
             else:
                 print(f"Filepath does not exist: {filepath}")
     elif p_args.extract_filepath != []:
-        for filepath in p_args.extract_filepath:
-            _ = dumper.file_exists(filepath)
-
+        dumper.files_exist(p_args.extract_filepath)
         dumper.dump()
     else:
         # Gen all the files and dump
-        load_filelist(dumper, filepath=p_args.filelist_path)
+        load_filelist(dumper, filepath=p_args.filelist_path, cache=not p_args.no_cache)
 
         # Dump only if this isn't a dry run
         if not p_args.dryrun:
             dumper.dump()
         else:
-            found = len(
-                [1 for k in dumper.entries if dumper.entries[k].filename is not None]
+            found = sum(
+                1 for entry in dumper.entries.values() if entry.filename is not None
             )
             print(f"Total files: {len(dumper.entries)}")
             print(f"Files found: {found}")
@@ -73,9 +77,7 @@ def parse_args(args: Optional[Sequence[str]] = None) -> argparse.Namespace:
             dir
     """
 
-    parser = argparse.ArgumentParser(
-        description="Dump data from GFDM V8 '.pak' files",
-    )
+    parser = make_base_parser(description="Dump data from GFDM V8 '.pak' files")
     parser.add_argument(
         "-i",
         "--input",
@@ -95,7 +97,7 @@ def parse_args(args: Optional[Sequence[str]] = None) -> argparse.Namespace:
     parser.add_argument(
         "-t",
         "--test-filepath",
-        type=Path,
+        type=str,
         default=[],
         nargs="+",
         help="Test one or more file paths to see if they exist in the pack data",
@@ -103,7 +105,7 @@ def parse_args(args: Optional[Sequence[str]] = None) -> argparse.Namespace:
     parser.add_argument(
         "-e",
         "--extract-filepath",
-        type=Path,
+        type=str,
         default=[],
         nargs="+",
         help="Extract one or more file paths if they exist",
@@ -122,42 +124,34 @@ def parse_args(args: Optional[Sequence[str]] = None) -> argparse.Namespace:
         default=DEFAULT_FILELIST_PATH,
         help="Path to list of files to extract",
     )
+    parser.add_argument(
+        "-n",
+        "--no-cache",
+        action="store_true",
+        help="Don't use or write the cache of found files for the filelist",
+    )
     parser.add_argument(
         "-r",
         "--dryrun",
         action="store_true",
         help="Perform a dry run. Don't actually extract any files",
     )
-
-    logger_group_parent = parser.add_argument_group(
-        title="logging arguments",
-        description="Control what log level the log outputs (default: ERROR)",
-    )
-    logger_group = logger_group_parent.add_mutually_exclusive_group()
-    default_log_level = logging.ERROR
-
-    logger_group.add_argument(
-        "-d",
-        "--debug",
-        dest="log_level",
-        action="store_const",
-        const=logging.DEBUG,
-        default=default_log_level,
-        help="Set log level to DEBUG",
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=positive_int,
+        default=1,
+        help="Number of threads to extract pack files with. Defaults to 1",
     )
-    logger_group.add_argument(
-        "-v",
-        "--verbose",
-        dest="log_level",
-        action="store_const",
-        const=logging.INFO,
-        default=default_log_level,
-        help="Set log level to INFO",
+    parser.add_argument(
+        "--verify",
+        action="store_true",
+        help="Check the MD5 sum of decrypted files again after decryption",
     )
 
     parsed_args = parser.parse_args(args)
 
-    if parsed_args.input.parts[-1] != "data":
+    if os.path.basename(parsed_args.input) != "data":
         raise argparse.ArgumentTypeError("input must be in the GFDM `data` directory")
 
     return parsed_args
@@ -1,4 +1,7 @@
 import argparse
+import logging
+import os
+import stat
 from pathlib import Path
 from typing import Any, Optional, Sequence, Union
 
@@ -19,8 +22,18 @@ class FullDirPath(argparse.Action):
         Resolve the input path and make sure it doesn't exist (so we can make it
         later), or that it's a directory.
         """
-        full_path = Path(str(values)).resolve()
-        if full_path.exists() and not full_path.is_dir():
+        full_path = Path(os.path.realpath(str(values)))
+
+        # One stat call tells us both if the path exists and if it is a directory.
+        # Only a missing path is fine, anything else that stops us reading it isn't
+        try:
+            is_dir = stat.S_ISDIR(os.stat(full_path).st_mode)
+        except FileNotFoundError:
+            is_dir = True
+        except NotADirectoryError:
+            is_dir = False
+
+        if not is_dir:
             raise argparse.ArgumentTypeError(f"{self.dest} must be a directory")
         setattr(namespace, self.dest, full_path)
 
@@ -40,5 +53,72 @@ class FullPath(argparse.Action):
         """
         Resolve the input path
         """
-        full_path = Path(str(values)).resolve()
+        full_path = Path(os.path.realpath(str(values)))
         setattr(namespace, self.dest, full_path)
+
+
+def positive_int(value: str) -> int:
+    """
+    argparse type to make sure an argument is a whole number greater than zero
+
+    Args:
+        value (str): Argument value to check
+
+    Returns:
+        int: The argument as an int
+
+    Raises:
+        argparse.ArgumentTypeError: If the argument isn't a positive whole number
+    """
+    try:
+        number = int(value)
+    except ValueError:
+        number = 0
+
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be a positive integer: {value!r}")
+
+    return number
+
+
+def make_base_parser(description: str) -> argparse.ArgumentParser:
+    """
+    Create an argument parser with the logging arguments shared by every CLI
+
+    Args:
+        description (str): Description of the program shown in the help output
+
+    Returns:
+        :class:`argparse.ArgumentParser`: Parser with the `-d/--debug` and
+            `-v/--verbose` log level arguments already added
+    """
+
+    parser = argparse.ArgumentParser(description=description)
+
+    logger_group_parent = parser.add_argument_group(
+        title="logging arguments",
+        description="Control what log level the log outputs (default: ERROR)",
+    )
+    logger_group = logger_group_parent.add_mutually_exclusive_group()
+    default_log_level = logging.ERROR
+
+    logger_group.add_argument(
+        "-d",
+        "--debug",
+        dest="log_level",
+        action="store_const",
+        const=logging.DEBUG,
+        default=default_log_level,
+        help="Set log level to DEBUG",
+    )
+    logger_group.add_argument(
+        "-v",
+        "--verbose",
+        dest="log_level",
+        action="store_const",
+        const=logging.INFO,
+        default=default_log_level,
+        help="Set log level to INFO",
+    )
+
+    return parser
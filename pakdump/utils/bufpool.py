@@ -0,0 +1,64 @@
+from typing import Dict, List
+
+
+class BufferPool(object):
+    """
+    Keeps a small number of spare bytearrays around so that extracting lots of files
+    doesn't allocate and free a new buffer for every single one.
+
+    Buffers are bucketed by size, rounded up to the next power of two, so the buffer
+    handed out can be bigger than requested. Slice a memoryview to the size needed.
+
+    Args:
+        max_buffers (int) = 8: Maximum number of spare buffers to keep per size bucket
+    """
+
+    def __init__(self, max_buffers: int = 8) -> None:
+        self.max_buffers = max_buffers
+        self.buckets: Dict[int, List[bytearray]] = {}
+
+    @staticmethod
+    def bucket_size(size: int) -> int:
+        """
+        Round a size up to the size of the bucket it belongs in
+
+        Args:
+            size (int): Requested size in bytes
+
+        Returns:
+            int: Bucket size in bytes
+        """
+        return 1 << (max(size, 1) - 1).bit_length()
+
+    def acquire(self, size: int) -> bytearray:
+        """
+        Get a buffer that is at least `size` bytes long
+
+        Args:
+            size (int): Minimum buffer size in bytes
+
+        Returns:
+            bytearray: A spare buffer, or a new one if there aren't any
+        """
+        bucket_size = self.bucket_size(size)
+        try:
+            return self.buckets.setdefault(bucket_size, []).pop()
+        except IndexError:
+            return bytearray(bucket_size)
+
+    def release(self, buffer: bytearray) -> None:
+        """
+        Give a buffer back to the pool once it is no longer used
+
+        Args:
+            buffer (bytearray): Buffer that came from :meth:`acquire`
+        """
+        bucket = self.buckets.setdefault(len(buffer), [])
+        if len(bucket) < self.max_buffers:
+            bucket.append(buffer)
+
+    def clear(self) -> None:
+        """
+        Drop every spare buffer so their memory can be freed
+        """
+        self.buckets.clear()
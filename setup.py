@@ -1,8 +1,9 @@
 import codecs
+import sys
 from os.path import abspath, dirname, join
 
 from Cython.Build import cythonize
-from setuptools import find_packages, setup
+from setuptools import Extension, find_packages, setup
 
 
 TEST_DEPS = ["coverage[toml]", "pytest", "pytest-cov"]
@@ -14,15 +15,32 @@ DOCS_DEPS = [
     "sphinxcontrib-runcmd",
 ]
 CHECK_DEPS = ["isort", "flake8", "flake8-quotes", "pep8-naming", "mypy", "black"]
+FAST_DEPS = ["orjson"]
 REQUIREMENTS = ["lxml"]
 
 EXTRAS = {
     "test": TEST_DEPS,
     "docs": DOCS_DEPS,
     "check": CHECK_DEPS,
+    "fast": FAST_DEPS,
     "dev": TEST_DEPS + DOCS_DEPS + CHECK_DEPS,
 }
 
+# Optimise the Cython extension harder than the default -O2. Nothing host specific
+# like -march=native is set so built wheels stay portable, set CFLAGS for that
+if sys.platform == "win32":
+    EXT_COMPILE_ARGS = ["/O2"]
+else:
+    EXT_COMPILE_ARGS = ["-O3"]
+
+EXTENSIONS = [
+    Extension(
+        "pakdec",
+        ["cython-deps/pakdec.pyx"],
+        extra_compile_args=EXT_COMPILE_ARGS,
+    )
+]
+
 # Read in the version
 with open(join(dirname(abspath(__file__)), "VERSION")) as version_file:
     version = version_file.read().strip()
@@ -39,7 +57,7 @@ setup(
     url="https://github.com/573dev/pakdump",
     packages=find_packages(exclude=["tests"]),
     install_requires=REQUIREMENTS,
-    ext_modules=cythonize(["cython-deps/pakdec.pyx"], annotate=True, language_level=3),
+    ext_modules=cythonize(EXTENSIONS, annotate=True, language_level=3),
     classifiers=[
         "Environment :: Console",
         "Intended Audience :: Developers",
@@ -0,0 +1,144 @@
+import hashlib
+import struct
+
+import pytest
+
+import pakdec
+from pakdump.dumper import PackInfo
+from pakdump.mdbe import MDB
+
+
+# Each pack is a list of (filename, kind). Plain entries are stored as is, encrypted
+# ones are stored encrypted, and damaged ones don't match their MD5 sum either way.
+# The first PakDumper.PACK_SAMPLE_SIZE entries decide what each pack looks like
+PACKS = [
+    # Looks encrypted, with a plain and a damaged entry after the sampled ones
+    [(f"/data/enc/{i}.bin", "encrypted") for i in range(5)]
+    + [("/data/enc/plain.bin", "plain"), ("/data/enc/damaged.bin", "damaged")],
+    # Looks plain, with an encrypted and a damaged entry after the sampled ones
+    [(f"/data/plain/{i}.bin", "plain") for i in range(5)]
+    + [("/data/plain/enc.bin", "encrypted"), ("/data/plain/damaged.bin", "damaged")],
+    # Mixed, so every entry gets checked on its own
+    [(f"/data/mixed/{i}.bin", ("plain", "encrypted")[i % 2]) for i in range(6)],
+]
+
+
+def crcs(filename: str) -> tuple:
+    return (
+        pakdec.crc32(filename.encode("ASCII")),
+        pakdec.crc16_ccitt_reverse(filename.encode("ASCII")),
+    )
+
+
+@pytest.fixture
+def pack_data(tmp_path):
+    """
+    Write a packinfo.bin and pack files to a temporary `data` dir. Returns the data
+    dir and the contents every file should be extracted with, or None if it should
+    fail to extract
+    """
+    pack_dir = tmp_path / "data" / "pack"
+    pack_dir.mkdir(parents=True)
+
+    expected = {}
+    info = bytearray()
+    for packid, files in enumerate(PACKS):
+        pack = bytearray()
+        for idx, (filename, kind) in enumerate(files):
+            crc32, crc16 = crcs(filename)
+
+            # Odd sizes to make sure the tail of the data is handled too
+            plain = bytes((packid * 31 + idx * 7 + n) & 0xFF for n in range(37 + idx))
+            md5sum = hashlib.md5(plain).digest()
+
+            stored = bytearray(plain)
+            if kind != "plain":
+                pakdec.decrypt(stored, len(stored), crc32, crc16)
+            if kind == "damaged":
+                stored[0] ^= 0xFF
+
+            info += struct.pack(
+                PackInfo.STRUCT_FORMAT,
+                md5sum,
+                crc32,
+                crc16,
+                packid,
+                len(pack),
+                len(stored),
+            )
+            pack += stored
+            expected[filename] = None if kind == "damaged" else plain
+
+        (pack_dir / f"pack{packid:04d}.pak").write_bytes(pack)
+
+    header = struct.pack("<8sI4x", b"", 0x10 + len(info))
+    (pack_dir / "packinfo.bin").write_bytes(header + info)
+
+    return tmp_path / "data", expected
+
+
+# Raw `mdbe.bin` record layouts, written out here rather than taken from pakdump.mdbe
+MDB_HEADER_FORMAT = "<8siihhhhh38x"
+MDB_SONG_FORMAT = "<i16sBB2B2BBBHH16sHHB2BBBBbb128sBBBB"
+MDB_COURSE_FORMAT = "<iI4i16s"
+
+# Titles fill the field, need escaping in XML, and are shorter than the field
+MDB_TITLES = [b"SIXTEEN CHARS!!!", b"R&B <Remix>", b"a"]
+
+
+@pytest.fixture
+def mdb_path(tmp_path):
+    """
+    Write a small encrypted `mdbe.bin` with a few songs and courses, and return its
+    path. tests/data/mdb.json and tests/data/mdb.xml hold what it exports to
+    """
+    data = bytearray(
+        struct.pack(MDB_HEADER_FORMAT, b"GF/DMmdb", 102, 0, 0x40, 188, 3, 2, 36)
+    )
+
+    for idx, title in enumerate(MDB_TITLES):
+        data += struct.pack(
+            MDB_SONG_FORMAT,
+            1000 + idx,
+            bytes(range(idx, idx + 16)),
+            idx,
+            idx + 1,
+            idx,
+            idx + 2,
+            8,
+            idx + 1,
+            idx % 2,
+            (idx + 1) % 2,
+            120 + idx,
+            180 + idx,
+            title,
+            idx * 300,
+            idx * 400,
+            idx + 5,
+            idx,
+            idx * 3,
+            idx,
+            idx + 2,
+            idx + 3,
+            -5 - idx,
+            idx * 10,
+            bytes((idx * 7 + n) & 0xFF for n in range(128)),
+            8,
+            idx,
+            idx + 1,
+            idx % 2,
+        )
+
+    for idx in range(2):
+        data += struct.pack(
+            MDB_COURSE_FORMAT,
+            idx + 1,
+            idx * 0x10001,
+            *(1000 + (idx + n) % 3 for n in range(4)),
+            bytes(range(16 * idx, 16 * idx + 16)),
+        )
+
+    mdb = MDB.__new__(MDB)
+    path = tmp_path / "mdbe.bin"
+    path.write_bytes(mdb.apply_encryption_key(data, decrypt=False))
+    return path
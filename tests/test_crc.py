@@ -0,0 +1,37 @@
+import zlib
+
+import pakdec
+from pakdump.crc import CRC16_CCITT_TABLE_REVERSE
+
+
+SAMPLES = [
+    b"",
+    b"/data/product/aep/dm_game.bin",
+    b"data/product/aep/gf_aep_list.bin",
+    bytes(range(256)),
+]
+
+
+def crc16_reference(data: bytes) -> int:
+    crc16 = 0xFFFF
+    for b in data:
+        crc16 = ((crc16 >> 8) ^ CRC16_CCITT_TABLE_REVERSE[(crc16 ^ b) & 0xFF]) & 0xFFFF
+    return ~crc16 & 0xFFFF
+
+
+# Make sure the Cython crc16 matches the table based version
+def test_crc16_ccitt_reverse():
+    for sample in SAMPLES:
+        assert pakdec.crc16_ccitt_reverse(sample) == crc16_reference(sample)
+
+    assert pakdec.crc16_ccitt_reverse_batch(SAMPLES) == [
+        crc16_reference(sample) for sample in SAMPLES
+    ]
+
+
+# Make sure the Cython crc32 matches zlib
+def test_crc32():
+    for sample in SAMPLES:
+        assert pakdec.crc32(sample) == zlib.crc32(sample)
+
+    assert pakdec.crc32_batch(SAMPLES) == [zlib.crc32(sample) for sample in SAMPLES]
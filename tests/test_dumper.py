@@ -0,0 +1,97 @@
+import os
+import stat
+
+import pytest
+
+from pakdump.dumper import PakDumper
+
+
+def make_dumper(data_dir, outputpath, filenames, **kwargs) -> PakDumper:
+    dumper = PakDumper(data_dir, outputpath, False, **kwargs)
+    assert all(dumper.files_exist(list(filenames)))
+    return dumper
+
+
+# Extracted files must match the original extraction, whatever each pack looks like.
+# Damaged entries are only caught when the decrypted data is verified, and nothing is
+# left mapped or pooled afterwards
+@pytest.mark.parametrize("jobs", [1, 2])
+@pytest.mark.parametrize("verify", [False, True])
+def test_dump(pack_data, tmp_path, jobs, verify):
+    data_dir, expected = pack_data
+    outputpath = tmp_path / "out"
+
+    dumper = make_dumper(data_dir, outputpath, expected, jobs=jobs, verify=verify)
+    dumper.dump()
+    assert not dumper.packmaps and not dumper.buffers.buckets
+
+    for filename, plain in expected.items():
+        output_path = outputpath / filename[1:]
+        if plain is not None:
+            assert output_path.read_bytes() == plain
+        elif verify:
+            assert not output_path.exists()
+
+
+# Extracting to memory after a dump must still check each entry on its own, rather
+# than reuse what a dump guessed about the pack
+def test_extract_data_mem_after_dump(pack_data, tmp_path):
+    data_dir, expected = pack_data
+    dumper = make_dumper(data_dir, tmp_path / "out", expected)
+    dumper.dump()
+
+    for filename, plain in expected.items():
+        if plain is not None:
+            key = dumper.calculate_filename_crc32(filename)
+            assert dumper.extract_data_mem(key) == plain
+
+
+# Existing files are only overwritten when forced
+@pytest.mark.parametrize("force", [False, True])
+def test_write_data_force(pack_data, tmp_path, force):
+    data_dir, expected = pack_data
+    outputpath = tmp_path / "out"
+    filenames = ["/data/enc/0.bin", "/data/plain/0.bin"]
+
+    for filename in filenames:
+        output_path = outputpath / filename[1:]
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        output_path.write_bytes(b"existing data that is longer than the entries" * 2)
+
+    dumper = make_dumper(data_dir, outputpath, expected)
+    dumper.force = force
+    dumper.dump()
+
+    for filename in filenames:
+        output_data = (outputpath / filename[1:]).read_bytes()
+        if force:
+            assert output_data == expected[filename]
+        else:
+            assert output_data.startswith(b"existing data")
+
+
+# file_exists is the single path version of files_exist
+def test_file_exists(pack_data, tmp_path):
+    data_dir, _ = pack_data
+    dumper = PakDumper(data_dir, tmp_path / "out", False)
+
+    assert dumper.file_exists("/data/enc/0.bin")
+    assert not dumper.file_exists("/data/enc/missing.bin")
+    key = dumper.calculate_filename_crc32("/data/enc/0.bin")
+    assert dumper.entries[key].filename == "/data/enc/0.bin"
+
+
+# Written files get the same permissions open() would give them
+@pytest.mark.skipif(os.name != "posix", reason="permissions are POSIX only")
+def test_write_data_mode(pack_data, tmp_path):
+    data_dir, expected = pack_data
+    outputpath = tmp_path / "out"
+
+    umask = os.umask(0o002)
+    try:
+        make_dumper(data_dir, outputpath, expected).dump()
+    finally:
+        os.umask(umask)
+
+    mode = (outputpath / "data/plain/0.bin").stat().st_mode
+    assert stat.S_IMODE(mode) == 0o664
@@ -0,0 +1,77 @@
+import json
+
+from pakdump.dumper import PakDumper
+from pakdump.filegen import get_cache_dir, get_cache_path, load_cache, load_filelist
+
+
+def write_filelist(tmp_path, expected):
+    filelist_path = tmp_path / "filelist.txt"
+    filelist_path.write_text("\n".join([*expected, "/data/missing.bin"]) + "\n")
+    return filelist_path
+
+
+def found_filenames(dumper):
+    return {e.filename for e in dumper.entries.values() if e.filename is not None}
+
+
+# Results written to the cache are loaded back the same on the next run
+def test_cache_round_trip(pack_data, tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    data_dir, expected = pack_data
+    filelist_path = write_filelist(tmp_path, expected)
+
+    dumper = PakDumper(data_dir, tmp_path / "out", False)
+    load_filelist(dumper, filepath=filelist_path)
+    assert found_filenames(dumper) == set(expected)
+
+    cache_path = get_cache_path(dumper, filelist_path)
+    assert [path.name for path in cache_path.parent.iterdir()] == [cache_path.name]
+
+    dumper = PakDumper(data_dir, tmp_path / "out", False)
+    assert load_cache(dumper, cache_path)
+    assert found_filenames(dumper) == set(expected)
+
+
+# A cache that doesn't match the packinfo.bin, or can't be read, is ignored
+def test_cache_rejected(pack_data, tmp_path):
+    data_dir, _ = pack_data
+    dumper = PakDumper(data_dir, tmp_path / "out", False)
+    cache_path = tmp_path / "cache.json"
+
+    stale = {"found": [[1, "/data/stale.bin"]], "missing": []}
+    cache_path.write_text(json.dumps(stale))
+    assert not load_cache(dumper, cache_path)
+
+    cache_path.write_text('{"found": [')
+    assert not load_cache(dumper, cache_path)
+
+    assert found_filenames(dumper) == set()
+
+
+# A failed write doesn't leave a temp file behind
+def test_cache_write_failure(pack_data, tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    data_dir, expected = pack_data
+    filelist_path = write_filelist(tmp_path, expected)
+
+    def failing_dump(obj, f):
+        f.write('{"found": ')
+        raise OSError("No space left on device")
+
+    monkeypatch.setattr(json, "dump", failing_dump)
+    load_filelist(PakDumper(data_dir, tmp_path / "out", False), filepath=filelist_path)
+
+    assert list((tmp_path / "cache" / "pakdump").iterdir()) == []
+
+
+# An empty or relative XDG_CACHE_HOME means the default is used
+def test_cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv("HOME", str(tmp_path))
+    default = tmp_path / ".cache" / "pakdump"
+
+    for cache_home in ["", "relative/cache"]:
+        monkeypatch.setenv("XDG_CACHE_HOME", cache_home)
+        assert get_cache_dir() == default
+
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    assert get_cache_dir() == tmp_path / "cache" / "pakdump"
@@ -0,0 +1,105 @@
+import json
+import struct
+from pathlib import Path
+
+import pytest
+
+from pakdump.mdbe import MDB, MDBHeader, MDBSong, _unpack_records
+
+
+DATA_DIR = Path(__file__).parent / "data"
+
+SAMPLES = [b"", b"\x00", bytes(range(71)), bytes(range(256)) * 3]
+
+
+def apply_key_reference(buffer: bytes, decrypt: bool) -> bytearray:
+    key = MDB.ENCRYPTION_KEY
+    bufflen = len(buffer)
+    output = bytearray(bufflen)
+    for idx in range(bufflen):
+        in_idx = bufflen - 1 - idx if decrypt else idx
+        out_idx = idx if decrypt else bufflen - 1 - idx
+        output[out_idx] = buffer[in_idx] ^ (
+            idx
+            + 16 * (idx % 8)
+            + (key[idx % 9] ^ (9 * (idx // 9) - idx + 127))
+            - 9 * (idx // 9)
+        )
+    return output
+
+
+# Make sure the Cython key stream matches the original per byte version
+def test_apply_encryption_key():
+    mdb = MDB.__new__(MDB)
+    for sample in SAMPLES:
+        for decrypt in (True, False):
+            assert mdb.apply_encryption_key(
+                bytearray(sample), decrypt=decrypt
+            ) == apply_key_reference(sample, decrypt)
+
+
+# Fields that don't fit their fixed size are rejected rather than truncated or padded
+def test_pack_field_lengths():
+    song = MDBSong.from_byte_data(MDBSong.STRUCT.unpack(bytes(MDBSong.STRUCT.size)))
+    song.title_ascii = "x" * 16
+    song.to_bytearray()
+
+    for name, value in [("title_ascii", "x" * 17), ("chart_list", bytes(127))]:
+        broken = MDBSong.from_byte_data(MDBSong.STRUCT.unpack(song.to_bytearray()))
+        setattr(broken, name, value)
+        with pytest.raises(ValueError):
+            broken.to_bytearray()
+
+    header = MDBHeader.from_rich_import(1, 0)
+    header.id = "GF/DM"
+    with pytest.raises(ValueError):
+        header.to_bytearray()
+
+
+# A truncated file fails to unpack rather than silently losing its last records
+def test_unpack_records_truncated():
+    size = MDBSong.STRUCT.size
+    data = bytearray(size * 2)
+
+    assert len(list(_unpack_records(MDBSong.STRUCT, data, 0, size, 2))) == 2
+    with pytest.raises(struct.error):
+        _unpack_records(MDBSong.STRUCT, data[:-1], 0, size, 2)
+
+
+# The objects built from mdbe.bin hold the same data the known-good export does
+def test_to_dict(mdb_path, tmp_path):
+    mdb = MDB(mdb_path, tmp_path, False)
+    known = json.loads((DATA_DIR / "mdb.json").read_text())["musicdb"]
+
+    # Tuples only become lists once they go through JSON
+    def to_json(objects):
+        return json.loads(json.dumps({k: v.to_dict() for k, v in objects.items()}))
+
+    assert mdb.header.to_dict() == known["header"]
+    assert to_json(mdb.songs) == known["songs"]
+    assert to_json(mdb.courses) == known["courses"]
+
+
+# Exported files match the ones written before any of the export speedups
+@pytest.mark.parametrize("export_type", ["JSON", "XML"])
+def test_export(mdb_path, tmp_path, export_type):
+    filename = f"mdb.{export_type.lower()}"
+
+    MDB(mdb_path, tmp_path, False, pretty_print=True).export(export_type)
+
+    assert (tmp_path / filename).read_bytes() == (DATA_DIR / filename).read_bytes()
+
+
+# Importing an exported JSON file recreates the original mdbe.bin, which then exports
+# to the same JSON again
+def test_json_round_trip(mdb_path, tmp_path):
+    first, second = tmp_path / "first", tmp_path / "second"
+    first.mkdir()
+    second.mkdir()
+
+    MDB(mdb_path, first, False).export()
+    MDB(first / "mdb.json", second / "mdbe.bin", False)
+    assert (second / "mdbe.bin").read_bytes() == mdb_path.read_bytes()
+
+    MDB(second / "mdbe.bin", second, False).export()
+    assert (second / "mdb.json").read_bytes() == (first / "mdb.json").read_bytes()